@@ -0,0 +1,105 @@
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import openai
+
+from llm_agent import EMBEDDING_MODEL, LLMAgent, embed_texts
+
+EMBEDDING_DIM = 1536
+
+
+class StandInEmbeddingHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the /embeddings endpoint: returns deterministic vectors
+    after a fixed latency per request plus a small cost per input.
+    """
+    request_latency = 0.05
+    input_latency = 0.0005
+    requests_served = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        time.sleep(self.request_latency + self.input_latency * len(inputs))
+        StandInEmbeddingHandler.requests_served += 1
+
+        data = []
+        for i, text in enumerate(inputs):
+            rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+            data.append({'object': 'embedding', 'index': i, 'embedding': rng.random(EMBEDDING_DIM).round(6).tolist()})
+        payload = json.dumps({'object': 'list', 'data': data, 'model': body.get('model', EMBEDDING_MODEL),
+                              'usage': {'prompt_tokens': 0, 'total_tokens': 0}}).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def embed_one_by_one(texts):
+    """
+    Reference implementation: one request per chunk, as build_knowledge_base used to do.
+    """
+    embeddings = []
+    for text in texts:
+        resp = openai.Embedding.create(input=text, model=EMBEDDING_MODEL)
+        embeddings.append(np.array(resp['data'][0]['embedding'], dtype=np.float32))
+    return np.stack(embeddings)
+
+
+def benchmark_embeddings(n_chunks=300, chunk_words=400):
+    """
+    Prints the time and request count of per-chunk and batched embedding
+    of the same synthetic chunks against the local stand-in server.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+    openai.api_key = "stand-in"
+
+    random.seed(0)
+    vocabulary = [f"mot{i}" for i in range(5000)]
+    texts = [' '.join(random.choices(vocabulary, k=chunk_words)) for _ in range(n_chunks)]
+
+    try:
+        StandInEmbeddingHandler.requests_served = 0
+        start_time = time.time()
+        reference = embed_one_by_one(texts)
+        one_by_one_time = time.time() - start_time
+        one_by_one_requests = StandInEmbeddingHandler.requests_served
+
+        StandInEmbeddingHandler.requests_served = 0
+        start_time = time.time()
+        batched = embed_texts(texts)
+        batched_time = time.time() - start_time
+        batched_requests = StandInEmbeddingHandler.requests_served
+
+        assert batched.dtype == np.float32 and np.array_equal(batched, reference), "Batched embeddings differ"
+
+        agent = LLMAgent()
+        start_time = time.time()
+        agent.build_knowledge_base(texts)
+        build_time = time.time() - start_time
+    finally:
+        server.shutdown()
+
+    print(f"{'mode':>12} {'requests':>9} {'time (s)':>9}")
+    print(f"{'one by one':>12} {one_by_one_requests:>9} {one_by_one_time:>9.2f}")
+    print(f"{'batched':>12} {batched_requests:>9} {batched_time:>9.2f}")
+    print(f"build_knowledge_base: {agent.index.ntotal} vectors in {build_time:.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_embeddings(n_chunks=int(sys.argv[1]))
+    else:
+        benchmark_embeddings()
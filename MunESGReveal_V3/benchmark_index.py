@@ -0,0 +1,62 @@
+import sys
+import time
+
+import numpy as np
+
+from llm_agent import INDEX_MODES, build_index, normalize_rows, set_search_params
+
+
+def make_corpus(n_municipalities, chunks_per_municipality, embedding_dim, rng):
+    """
+    Synthetic normalized embeddings: each municipality's chunks are spread around its own centre,
+    which mimics the clustering of real report chunks.
+    """
+    centres = rng.standard_normal((n_municipalities, embedding_dim)).astype(np.float32)
+    corpus = np.repeat(centres, chunks_per_municipality, axis=0)
+    corpus += rng.standard_normal(corpus.shape).astype(np.float32) * 1.5
+    return normalize_rows(corpus)
+
+
+def recall_at_k(found, expected):
+    """
+    Share of the exact top-k neighbours also returned by the approximate search.
+    """
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+
+def benchmark_index(municipality_counts=(1, 10, 50, 100), chunks_per_municipality=500, embedding_dim=1536,
+                    n_queries=200, k=3):
+    """
+    Prints, for each index mode and corpus size, the build time, the search latency per query
+    (one batched search) and the recall@k against the exact flat index.
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'municipalities':>14} {'chunks':>8} {'mode':>6} {'build (s)':>10} {'ms/query':>9} {'recall@' + str(k):>9}")
+    for n_municipalities in municipality_counts:
+        corpus = make_corpus(n_municipalities, chunks_per_municipality, embedding_dim, rng)
+        # Queries close to random chunks, like indicator questions close to report passages
+        picks = rng.integers(0, len(corpus), n_queries)
+        queries = normalize_rows(corpus[picks] + rng.standard_normal((n_queries, embedding_dim)).astype(np.float32))
+
+        expected = None
+        for index_mode in INDEX_MODES:
+            start_time = time.time()
+            index = build_index(corpus, index_mode)
+            set_search_params(index, index_mode)
+            build_time = time.time() - start_time
+
+            start_time = time.time()
+            _, indices = index.search(queries, k)
+            latency = (time.time() - start_time) / n_queries * 1000
+
+            if expected is None:
+                expected = indices  # 'flat' comes first and is exact
+            print(f"{n_municipalities:>14} {len(corpus):>8} {index_mode:>6} {build_time:>10.2f} "
+                  f"{latency:>9.3f} {recall_at_k(indices, expected):>9.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_index(municipality_counts=[int(arg) for arg in sys.argv[1:]])
+    else:
+        benchmark_index()
@@ -1,105 +1,375 @@
 # llm_agent.py
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import faiss
 import numpy as np
 import openai
-from sklearn.metrics.pairwise import cosine_similarity
+import tiktoken
+from rate_limiter import cached_chat_completion, chat_completion
+from vector_store import VectorStore, chunk_hash
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+ANSWER_MODEL = "gpt-4"
+# Limits of one embedding request: total tokens and number of inputs
+MAX_BATCH_TOKENS = 100_000
+MAX_BATCH_INPUTS = 2048
+# Longest input accepted by the embedding model
+MAX_INPUT_TOKENS = 8191
+# 'flat': exact inner product; 'hnsw' and 'ivf': approximate, for large corpora
+INDEX_MODES = ('flat', 'hnsw', 'ivf')
+
+MAX_CHUNK_TOKENS = 800
+# Section headers written by main() and excel_parser in the combined documents
+SECTION_HEADER = re.compile(r'^\[(PDF|Excel|CSV|DATA): (.+)\]$', re.MULTILINE)
+TABLE_SECTIONS = ('Excel', 'CSV', 'DATA')
+# Page separator written by ReportPreprocessor.extract_text_from_pdf
+PAGE_BREAK = '\f'
+
+
+def split_sections(doc, source=None):
+    """
+    Splits a combined document at its section headers.
+    
+    :return: A list of (header line, kind, file, body); text before the first header
+             is a 'PDF' section of 'source' without header.
+    """
+    matches = list(SECTION_HEADER.finditer(doc))
+    sections = []
+    leading = doc[:matches[0].start()] if matches else doc
+    if leading.strip():
+        sections.append(('', 'PDF', source, leading))
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        body = doc[match.end():next_match.start() if next_match else len(doc)]
+        sections.append((match.group(0), match.group(1), match.group(2), body))
+    return sections
+
+
+def split_to_fit(text, max_tokens, encoding):
+    """
+    Splits a paragraph or row longer than 'max_tokens' at lines, then at sentences,
+    and as a last resort at token boundaries.
+    """
+    if len(encoding.encode(text, disallowed_special=())) <= max_tokens:
+        return [text]
+    for pattern in (r'\n', r'(?<=[.!?;:])\s+'):
+        parts = [part for part in re.split(pattern, text) if part.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in split_to_fit(part, max_tokens, encoding)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
 
 
-def split_document(doc, max_chars=3000, overlap=200):
+def split_document(doc, max_tokens=MAX_CHUNK_TOKENS, source=None):
     """
-    Splits a long document into smaller chunks.
+    Splits a combined PDF/Excel/CSV document into chunks of at most about 'max_tokens' tokens.
+    Chunks never span two sections and are cut between pages, paragraphs or table rows
+    (between lines or sentences only for a paragraph too long on its own), without overlap.
+    Each chunk starts with its section header; table chunks also repeat the column header row.
     
     :param doc: The full document string.
-    :param max_chars: Maximum number of characters per chunk.
-    :param overlap: Number of overlapping characters between chunks.
-    :return: A list of document chunks.
+    :param max_tokens: Token budget of a chunk (tiktoken, cl100k_base).
+    :param source: File of the text found before the first section header.
+    :return: A list of {'text': ..., 'metadata': {'file': ..., 'pages': [first, last] or None}}.
     """
+    encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(text):
+        return len(encoding.encode(text, disallowed_special=()))
+
     chunks = []
-    start = 0
-    while start < len(doc):
-        end = start + max_chars
-        chunks.append(doc[start:end])
-        start += max_chars - overlap
+    for header, kind, file, body in split_sections(doc, source):
+        units = []  # (text, page number or None, separator before the unit)
+        if kind in TABLE_SECTIONS:
+            rows = [row for row in body.split('\n') if row.strip()]
+            if not rows:
+                continue
+            prefix = "\n".join(line for line in (header, rows[0]) if line)
+            budget = max(max_tokens - count(prefix) - 1, 50)
+            for row in rows[1:]:
+                units.extend((piece, None, '\n') for piece in split_to_fit(row, budget, encoding))
+        else:
+            if not body.strip():
+                continue
+            prefix = header
+            budget = max(max_tokens - count(prefix) - 1, 50)
+            pages = body.split(PAGE_BREAK)
+            for page_number, page in enumerate(pages, start=1):
+                for paragraph in re.split(r'\n\s*\n', page):
+                    if not paragraph.strip():
+                        continue
+                    for i, piece in enumerate(split_to_fit(paragraph.strip(), budget, encoding)):
+                        # Pages are only known when the text still has its page breaks
+                        units.append((piece, page_number if len(pages) > 1 else None, '\n\n' if i == 0 else '\n'))
+
+        def add_chunk(parts, pages):
+            text = "\n".join(part for part in (prefix, "".join(parts)) if part)
+            chunks.append({'text': text, 'metadata': {'file': file,
+                                                      'pages': [min(pages), max(pages)] if pages else None}})
+
+        parts, parts_tokens, parts_pages = [], 0, []
+        for text, page_number, separator in units:
+            n_tokens = count(text) + 1
+            if parts and parts_tokens + n_tokens > budget:
+                add_chunk(parts, parts_pages)
+                parts, parts_tokens, parts_pages = [], 0, []
+            parts.append(separator + text if parts else text)
+            parts_tokens += n_tokens
+            if page_number is not None:
+                parts_pages.append(page_number)
+        if parts or not units:
+            add_chunk(parts, parts_pages)
     return chunks
 
+def make_embedding_batches(texts, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_inputs=MAX_BATCH_INPUTS):
+    """
+    Groups texts into consecutive batches whose total token count stays within the request budget.
+    
+    :return: A list of (start index, list of texts) batches.
+    """
+    encoding = tiktoken.get_encoding("cl100k_base")
+    batches = []
+    start, batch, batch_tokens = 0, [], 0
+    for i, text in enumerate(texts):
+        n_tokens = min(len(encoding.encode(text, disallowed_special=())), MAX_INPUT_TOKENS)
+        if batch and (batch_tokens + n_tokens > max_batch_tokens or len(batch) >= max_batch_inputs):
+            batches.append((start, batch))
+            start, batch, batch_tokens = i, [], 0
+        batch.append(text)
+        batch_tokens += n_tokens
+    if batch:
+        batches.append((start, batch))
+    return batches
+
+
+def embed_texts(texts, model=EMBEDDING_MODEL, max_batch_tokens=MAX_BATCH_TOKENS, max_workers=4):
+    """
+    Embeds texts with token-budgeted batch requests, at most 'max_workers' in flight at once.
+    
+    :return: A float32 matrix with one row per text, in the order of 'texts'.
+    """
+    embeddings = None
+    batches = make_embedding_batches(texts, max_batch_tokens)
+
+    def embed_batch(batch):
+        start, batch_texts = batch
+        resp = openai.Embedding.create(input=batch_texts, model=model)
+        return start, resp['data']
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for start, data in executor.map(embed_batch, batches):
+            if embeddings is None:
+                # Preallocated once the embedding size is known
+                embeddings = np.empty((len(texts), len(data[0]['embedding'])), dtype=np.float32)
+            for item in data:
+                embeddings[start + item['index']] = item['embedding']
+    return embeddings
+
+
+def normalize_rows(embeddings):
+    """
+    Scales every row to unit length, in place, so that inner product equals cosine similarity.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def ivf_list_count(n):
+    """
+    Default number of inverted lists for 'n' vectors: about 4 * sqrt(n), with at least
+    39 training vectors per list.
+    """
+    return max(1, min(int(4 * n ** 0.5), n // 39))
+
+
+def build_index(embeddings, index_mode='flat', hnsw_neighbors=32, ivf_lists=None):
+    """
+    Builds an inner-product FAISS index over normalized embeddings.
+    
+    :param index_mode: 'flat' (exact), 'hnsw' (graph) or 'ivf' (inverted lists, trained on the embeddings).
+    :param hnsw_neighbors: Number of graph neighbours per vector for 'hnsw'.
+    :param ivf_lists: Number of inverted lists for 'ivf' (by default about 4 * sqrt(n),
+                      see ivf_list_count).
+    """
+    n, embedding_dim = embeddings.shape
+    if index_mode == 'flat':
+        index = faiss.IndexFlatIP(embedding_dim)
+    elif index_mode == 'hnsw':
+        index = faiss.IndexHNSWFlat(embedding_dim, hnsw_neighbors, faiss.METRIC_INNER_PRODUCT)
+    elif index_mode == 'ivf':
+        n_lists = ivf_lists or ivf_list_count(n)
+        quantizer = faiss.IndexFlatIP(embedding_dim)
+        index = faiss.IndexIVFFlat(quantizer, embedding_dim, n_lists, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Mode d'index inconnu : {index_mode} (attendu : {', '.join(INDEX_MODES)})")
+    index.add(embeddings)
+    return index
+
+
+def set_search_params(index, index_mode, nprobe=8, ef_search=64):
+    """
+    Sets the speed/recall trade-off of approximate indexes: lists visited for 'ivf',
+    candidate list size for 'hnsw'.
+    """
+    if index_mode == 'ivf':
+        index.nprobe = nprobe
+    elif index_mode == 'hnsw':
+        index.hnsw.efSearch = ef_search
+
+
 class LLMAgent:
     """
     Implements a Retrieval-Augmented Generation (RAG) pipeline using FAISS and OpenAI embeddings.
     """
-    def __init__(self):
+    def __init__(self, store_directory=None, index_mode='flat', nprobe=8, ef_search=64):
+        """
+        :param store_directory: Directory where the knowledge base is saved between runs
+                                (kept in memory only when None).
+        :param index_mode: One of INDEX_MODES; see build_index.
+        :param nprobe: Inverted lists visited per query in 'ivf' mode.
+        :param ef_search: Candidate list size per query in 'hnsw' mode.
+        """
+        if index_mode not in INDEX_MODES:
+            raise ValueError(f"Mode d'index inconnu : {index_mode} (attendu : {', '.join(INDEX_MODES)})")
         self.documents = []
-        self.embeddings = []
+        self.chunk_metadata = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
         self.index = None
+        self.index_mode = index_mode
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.store = VectorStore(store_directory, EMBEDDING_MODEL) if store_directory else None
 
-    def build_knowledge_base(self, list_of_texts):
+    def build_knowledge_base(self, list_of_texts, sources=None):
         """
-        Builds a FAISS index from a list of text documents. 
-        If a document is too long, it will be split into smaller chunks.
+        Builds a FAISS index from a list of text documents, split into token-sized chunks
+        along their sections, pages, paragraphs and table rows (see split_document).
+        With a store directory, only chunks not already saved there are embedded.
         
         :param list_of_texts: List of strings (each could be a PDF+Excel combined text)
+        :param sources: Optional name of each document (e.g. its PDF path), kept in the chunk metadata.
         """
         self.documents = []
-        self.embeddings = []
-        for doc in list_of_texts:
-            # If the document is too long, split it
-            if len(doc) > 3000:
-                chunks = split_document(doc, max_chars=3000, overlap=200)
-                self.documents.extend(chunks)
-            else:
-                self.documents.append(doc)
-
-        if not self.documents:
+        self.chunk_metadata = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        chunks = {}  # content hash -> chunk; identical chunks are indexed once
+        for doc_number, doc in enumerate(list_of_texts):
+            source = sources[doc_number] if sources else f"document {doc_number}"
+            for doc_chunk in split_document(doc, source=source):
+                text = doc_chunk['text']
+                key = chunk_hash(text, EMBEDDING_MODEL)
+                chunk = chunks.setdefault(key, {'hash': key, 'text': text,
+                                                'metadata': dict(doc_chunk['metadata'], sources=[])})
+                if source not in chunk['metadata']['sources']:
+                    chunk['metadata']['sources'].append(source)
+        chunks = list(chunks.values())
+
+        if not chunks:
             print("Aucun document à indexer.")
             return
 
-        for doc in self.documents:
-            resp = openai.Embedding.create(input=doc, model="text-embedding-ada-002")
-            embedding = resp['data'][0]['embedding']
-            self.embeddings.append(np.array(embedding, dtype=np.float32))
+        if self.store is None:
+            # Batched embedding requests, written straight into one float32 matrix
+            self.embeddings = normalize_rows(embed_texts([chunk['text'] for chunk in chunks]))
+            self.index = build_index(self.embeddings, self.index_mode)
+        else:
+            self.embeddings, self.index = self.update_store(chunks)
+        set_search_params(self.index, self.index_mode, self.nprobe, self.ef_search)
+        self.documents = [chunk['text'] for chunk in chunks]
+        self.chunk_metadata = [chunk['metadata'] for chunk in chunks]
 
-        embedding_dim = len(self.embeddings[0])
-        self.index = faiss.IndexFlatL2(embedding_dim)
-        self.index.add(np.stack(self.embeddings))
-
-    """def retrieve_relevant_chunks(self, query, top_k=5):
-        
-        Retrieves the most relevant chunks from the knowledge base for a given query.
+    def update_store(self, chunks):
+        """
+        Embeds the chunks missing from the store and saves the store when it changed.
+        The saved index is reused as is when the chunks are unchanged, and extended
+        when chunks were only appended; otherwise it is rebuilt from the saved vectors.
+        An 'ivf' index is also rebuilt, to retrain its lists, once the corpus has outgrown them.
         
-        if not self.index or not self.embeddings:
-            return []
-        resp = openai.Embedding.create(input=query, model="text-embedding-ada-002")
-        query_vec = np.array(resp['data'][0]['embedding'], dtype=np.float32).reshape(1, -1)
-        distances, indices = self.index.search(query_vec, top_k)
-        return [self.documents[idx] for idx in indices[0]]"""
+        :return: (embeddings, index) for the chunks, in their order.
+        """
+        self.store.load()
+        stored_hashes = [chunk['hash'] for chunk in self.store.chunks]
+        stored_rows = {key: row for row, key in enumerate(stored_hashes)}
+        new_chunks = [chunk for chunk in chunks if chunk['hash'] not in stored_rows]
+        print(f"{len(chunks) - len(new_chunks)} chunks réutilisés, {len(new_chunks)} chunks à encoder.")
+        new_embeddings = normalize_rows(embed_texts([chunk['text'] for chunk in new_chunks])) if new_chunks else None
 
-    def retrieve_relevant_chunks(self, query, top_k=5, rerank_top_k=3):
-        if not self.index or not self.embeddings:
-            return []
+        index = self.store.read_index(self.index_mode)
+        hashes = [chunk['hash'] for chunk in chunks]
+        rebuilt = index is None or hashes[:len(stored_hashes)] != stored_hashes
+        # Appended vectors go into lists trained on the old corpus: retrain once the
+        # default list count has doubled (about 4x more vectors than at training time)
+        if not rebuilt and self.index_mode == 'ivf':
+            rebuilt = ivf_list_count(len(chunks)) >= 2 * index.nlist
+        if not rebuilt:
+            embeddings = self.store.embeddings
+            if new_chunks:
+                embeddings = np.vstack([embeddings, new_embeddings])
+                index.add(new_embeddings)
+        else:
+            embedding_dim = (new_embeddings if new_embeddings is not None else self.store.embeddings).shape[1]
+            embeddings = np.empty((len(chunks), embedding_dim), dtype=np.float32)
+            new_rows = {chunk['hash']: row for row, chunk in enumerate(new_chunks)}
+            for row, key in enumerate(hashes):
+                if key in new_rows:
+                    embeddings[row] = new_embeddings[new_rows[key]]
+                else:
+                    embeddings[row] = self.store.embeddings[stored_rows[key]]
+            # Stores saved before the vectors were normalized are normalized here once
+            index = build_index(normalize_rows(embeddings), self.index_mode)
 
-        # Embedding de la requête
-        resp = openai.Embedding.create(input=query, model="text-embedding-ada-002")
-        query_vec = np.array(resp['data'][0]['embedding'], dtype=np.float32).reshape(1, -1)
+        if rebuilt or chunks != self.store.chunks:
+            self.store.save(chunks, embeddings, index, self.index_mode)
+        return embeddings, index
 
-        # Recherche initiale avec FAISS
-        distances, indices = self.index.search(query_vec, top_k)
+    def embed_queries(self, queries):
+        """
+        Embeds all queries in one batch. With a store directory, queries embedded
+        in a previous run (e.g. the indicator guidelines) are read back from disk.
+        
+        :return: A float32 matrix with one row per query.
+        """
+        keys = [chunk_hash(query, EMBEDDING_MODEL) for query in queries]
+        cached = self.store.load_query_embeddings() if self.store else {}
+        missing = {key: query for key, query in zip(keys, queries) if key not in cached}
+        if missing:
+            for key, embedding in zip(missing, embed_texts(list(missing.values()))):
+                cached[key] = embedding
+            if self.store:
+                self.store.save_query_embeddings(cached)
+        return np.stack([cached[key] for key in keys])
+
+    def retrieve_batch(self, queries, top_k=3):
+        """
+        Retrieves the 'top_k' most similar chunks (cosine) of every query with one batched index search.
+        
+        :return: One list of chunks per query, in the order of 'queries'.
+        """
+        if self.index is None or len(self.embeddings) == 0:
+            return [[] for _ in queries]
 
-        # Récupération des documents et embeddings correspondants
-        retrieved_docs = [self.documents[i] for i in indices[0]]
-        retrieved_embeds = [self.embeddings[i] for i in indices[0]]
+        # Embedding des requêtes, normalisé comme celui des chunks
+        query_vecs = normalize_rows(self.embed_queries(queries))
 
-        # Reranking par similarité cosinus
-        sims = cosine_similarity(query_vec, np.stack(retrieved_embeds))[0]  # shape: (top_k,)
-        ranked_pairs = sorted(zip(sims, retrieved_docs), reverse=True)
+        # Recherche avec FAISS, toutes les requêtes à la fois, déjà triée par similarité décroissante
+        similarities, indices = self.index.search(query_vecs, top_k)
 
-        # Retourne les rerank_top_k documents les plus pertinents
-        return [doc for _, doc in ranked_pairs[:rerank_top_k]]
+        # FAISS pads with -1 when there are fewer chunks than top_k
+        return [[self.documents[i] for i in row if i >= 0] for row in indices]
 
-    def answer_query(self, query):
+    def retrieve_relevant_chunks(self, query, top_k=3):
+        return self.retrieve_batch([query], top_k)[0]
+
+    def query_messages(self, query, top_docs=None):
         """
-        Retrieves relevant documents from the knowledge base and queries the LLM with that context.
-        Returns the LLM's answer.
+        Builds the chat messages asking the LLM to answer the query from the relevant documents.
+        
+        :param top_docs: Chunks already retrieved for the query (see retrieve_batch).
         """
-        top_docs = self.retrieve_relevant_chunks(query, top_k=5)
+        if top_docs is None:
+            top_docs = self.retrieve_relevant_chunks(query)
         context = "\n".join(top_docs)
         #system_prompt = (
             #"Vous êtes un assistant AI spécialisé dans l'extraction d'informations à partir de rapports municipaux "
@@ -137,12 +407,20 @@ class LLMAgent:
                   "5. Si vous n’êtes pas sûr, reconnaissez simplement le manque d’information au lieu d’inventer une réponse.\n"
                 )
 
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0
-        )
-        return response['choices'][0]['message']['content']
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def answer_query(self, query, top_docs=None):
+        """
+        Retrieves relevant documents from the knowledge base and queries the LLM with that context.
+        Returns the LLM's answer.
+        """
+        return cached_chat_completion(ANSWER_MODEL, self.query_messages(query, top_docs), temperature=0)
+
+    async def answer_query_async(self, query, top_docs, limiter):
+        """
+        Same as answer_query, as a coroutine whose LLM call goes through the rate limiter.
+        """
+        return await chat_completion(limiter, ANSWER_MODEL, self.query_messages(query, top_docs), temperature=0)
@@ -1,4 +1,5 @@
 # main.py
+import asyncio
 import os
 import re
 import sys
@@ -11,10 +12,11 @@ from excel_parser import parse_data_files
 from llm_agent import LLMAgent
 from munesg_config import MetadataFramework
 from preprocessor import ReportPreprocessor
+from rate_limiter import RateLimiter, cached_chat_completion, chat_completion, get_llm_cache
 from summarizer import summarize_text
 
 
-def aggregate_category(category, indicators_info):
+def aggregate_category_messages(category, indicators_info):
     """
     For a given category (e.g., "Environnement", "Social", "Gouvernance") and a list of tuples 
     (indicator, response), build a prompt to ask the LLM for an overall success percentage 
@@ -30,15 +32,47 @@ def aggregate_category(category, indicators_info):
         "Pourcentage global: XX%\nDétails:\n- Indicateur 1: XX%\n- Indicateur 2: XX%\n..."
     )
     system_prompt = "Vous êtes un expert en évaluation municipale fournissant des analyses détaillées."
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0
-    )
-    return response['choices'][0]['message']['content']
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def aggregate_category(category, indicators_info):
+    return cached_chat_completion("gpt-4", aggregate_category_messages(category, indicators_info), temperature=0)
+
+
+async def run_indicators(agent, infos, queries, contexts, requests_per_minute=60, tokens_per_minute=40_000,
+                         max_concurrency=8):
+    """
+    Asks the LLM about every indicator concurrently, then aggregates each category,
+    within the request and token budgets of one shared rate limiter.
+    
+    :return: (category_results, aggregations) where category_results maps each category to its
+             (indicator, response) tuples in the order of 'infos', and aggregations maps each
+             category to the LLM aggregation text.
+    """
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_concurrency)
+
+    async def ask(info, query, top_docs):
+        print(f"\n[INFO] Interrogation de l'LLM sur: {query}")
+        answer = await agent.answer_query_async(query, top_docs, limiter)
+        print(f"\n===== Réponse pour '{info['Indicateur']}' =====")
+        print(answer)
+        return answer
+
+    answers = await asyncio.gather(*(ask(info, query, top_docs)
+                                     for info, query, top_docs in zip(infos, queries, contexts)))
+
+    category_results = {}  # Dictionary: key=category, value=list of (indicator, response)
+    for info, answer in zip(infos, answers):
+        category_results.setdefault(info["Dimension"], []).append((info["Indicateur"], answer))
+
+    aggregations = await asyncio.gather(*(
+        chat_completion(limiter, "gpt-4", aggregate_category_messages(cat, indicators_info), temperature=0)
+        for cat, indicators_info in category_results.items()
+    ))
+    return category_results, dict(zip(category_results, aggregations))
 
 
     
@@ -234,23 +268,20 @@ def main():
         documents.append(combined_text)
 
     # Build the knowledge base using the LLM agent
-    agent = LLMAgent()
-    agent.build_knowledge_base(documents)
+    # Chunks already embedded in a previous run are reused from the store
+    agent = LLMAgent(store_directory=os.path.join(folder, "vector_store"))
+    agent.build_knowledge_base(documents, sources=pdf_files)
 
     # Query each indicator and store results by category
-    category_results = {}  # Dictionary: key=category, value=list of (indicator, response)
     indicators = metadata.get_all_indicators()
-    for ind in indicators:
-        info = metadata.get_indicator_info(ind)
-        query = f"{info['Indicateur']}. {info['Description']}"
-        print(f"\n[INFO] Interrogation de l'LLM sur: {query}")
-        answer = agent.answer_query(query)
-        print(f"\n===== Réponse pour '{info['Indicateur']}' =====")
-        print(answer)
-        cat = info["Dimension"]
-        if cat not in category_results:
-            category_results[cat] = []
-        category_results[cat].append((info["Indicateur"], answer))
+    infos = [metadata.get_indicator_info(ind) for ind in indicators]
+    queries = [f"{info['Indicateur']}. {info['Description']}" for info in infos]
+
+    # Retrieval for all indicators at once, before any LLM call
+    contexts = agent.retrieve_batch(queries)
+
+    # Indicator questions and category aggregations run concurrently, within the rate limits
+    category_results, aggregations = asyncio.run(run_indicators(agent, infos, queries, contexts))
 
     # Aggregate results by category and display overall success percentage and detailed scores
     """for cat, indicators_info in category_results.items():
@@ -279,9 +310,7 @@ def main():
         
     aggregated_scores = {}
 
-    for cat, indicators_info in category_results.items():
-        aggregated = aggregate_category(cat, indicators_info)
-
+    for cat, aggregated in aggregations.items():
         # Parse pourcentage global et scores détaillés à partir de la réponse texte
         score_match = re.search(r"Pourcentage global\s*:\s*(\d+)", aggregated)
         if score_match:
@@ -330,6 +359,7 @@ def main():
         df_aggregated.to_excel(writer, index=False, sheet_name="Scores Agrégés")
 
     print(f"\n[INFO] Résultats complets exportés vers : {output_file}")
+    print(f"[INFO] Cache des réponses LLM : {get_llm_cache().stats()}")
 
 
     # Interface interactive human-in-the-loop
@@ -1,33 +1,98 @@
 # preprocessor.py
 import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import pytesseract
 from pdf2image import convert_from_path
-from PyPDF2 import PdfReader
+
+# The extracted-text cache lives at the project root and is shared with the other PDF readers
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_cache import get_page_texts_with_ocr
+
+
+def ocr_image_file(image_path, lang):
+    """
+    Applique tesseract à une image rendue sur disque et retourne (texte, durée en secondes).
+    """
+    start_time = time.time()
+    text = pytesseract.image_to_string(image_path, lang=lang)
+    return text, time.time() - start_time
+
+
+def init_ocr_worker():
+    """
+    Limite tesseract à un thread OpenMP : les pages sont déjà réparties sur un processus par cœur.
+    """
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def page_runs(page_numbers):
+    """
+    Regroupe les numéros de page en suites consécutives : [1, 2, 3, 7, 9, 10] -> [(1, 3), (7, 7), (9, 10)].
+    """
+    runs = []
+    for page_number in sorted(set(page_numbers)):
+        if runs and page_number == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page_number)
+        else:
+            runs.append((page_number, page_number))
+    return runs
 
 
 class ReportPreprocessor:
     """
     Extrait le texte d'un fichier PDF.
     Utilise PyPDF2 pour extraire le texte numérique et effectue de l'OCR si nécessaire.
+    L'OCR des pages sans texte est réparti sur 'ocr_workers' processus (tous les cœurs par défaut).
     """
-    def __init__(self, ocr_language='fra'):
+    def __init__(self, ocr_language='fra', ocr_workers=None, ocr_dpi=300):
         self.ocr_language = ocr_language
+        self.ocr_workers = ocr_workers or os.cpu_count()
+        self.ocr_dpi = ocr_dpi
+        self.ocr_timings = []
+
+    def ocr_pages(self, pdf_path, page_numbers, lang, dpi):
+        """
+        Rend seulement les pages à lire (numérotées à partir de 1), une passe par suite de pages
+        consécutives, puis applique tesseract en parallèle. Retourne {numéro de page: texte},
+        dans l'ordre des pages.
+        """
+        self.ocr_timings = []
+        with tempfile.TemporaryDirectory() as output_folder:
+            start_time = time.time()
+            image_paths = {}
+            for first_page, last_page in page_runs(page_numbers):
+                # Images written to disk rather than held in memory; one path per page of the run
+                run_paths = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                                              output_folder=output_folder, fmt="png", paths_only=True,
+                                              thread_count=self.ocr_workers)
+                image_paths.update(zip(range(first_page, last_page + 1), run_paths))
+            print(f"[INFO] Rendu de {len(image_paths)} pages en {time.time() - start_time:.2f} s")
+
+            selected_paths = [image_paths[page_number] for page_number in page_numbers]
+            with ProcessPoolExecutor(max_workers=self.ocr_workers, initializer=init_ocr_worker) as executor:
+                results = list(executor.map(ocr_image_file, selected_paths, [lang] * len(selected_paths)))
+
+        texts = {}
+        for page_number, (text, elapsed_time) in zip(page_numbers, results):
+            texts[page_number] = text
+            self.ocr_timings.append((page_number, elapsed_time))
+            print(f"[INFO] OCR page {page_number}: {elapsed_time:.2f} s")
+        return texts
 
     def extract_text_from_pdf(self, pdf_path):
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"Fichier introuvable: {pdf_path}")
-        reader = PdfReader(pdf_path)
+        # Digital text and OCR of pages without text both come from the shared cache
+        page_texts, _ = get_page_texts_with_ocr(pdf_path, lang=self.ocr_language, dpi=self.ocr_dpi,
+                                                ocr_pages=self.ocr_pages)
+        # Pages are separated by a form feed so that the chunker can keep track of page numbers
         full_text = ""
-        for i, page in enumerate(reader.pages):
-            page_text = page.extract_text()
-            if page_text and page_text.strip():
-                full_text += page_text + "\n"
-            else:
-                images = convert_from_path(pdf_path, first_page=i+1, last_page=i+1, dpi=300)
-                for img in images:
-                    ocr_text = pytesseract.image_to_string(img, lang=self.ocr_language)
-                    full_text += ocr_text + "\n"
+        for page_text in page_texts:
+            full_text += page_text + "\n\f"
         return full_text
 
     def build_knowledge_base(self, text_content):
@@ -0,0 +1,133 @@
+# rate_limiter.py
+import asyncio
+import os
+import random
+import sys
+import time
+
+import openai
+import tiktoken
+
+# The LLM response cache lives at the project root and is shared with the other LLM callers
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import get_llm_cache
+
+
+def count_message_tokens(messages):
+    """
+    Approximate number of prompt tokens of a chat request (content plus a few tokens per message).
+    """
+    encoding = tiktoken.get_encoding("cl100k_base")
+    return sum(len(encoding.encode(message["content"], disallowed_special=())) + 4 for message in messages) + 2
+
+
+class TokenBucket:
+    """
+    Bucket holding up to 'per_minute' units, refilled continuously at per_minute / 60 units per second.
+    """
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """
+        Seconds before 'amount' units are available (0 when they already are).
+        """
+        self.refill()
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Keeps concurrent OpenAI calls within a number of requests in flight and a budget of
+    requests and tokens per minute. A 429 pauses every caller before the request is retried.
+
+    Must be created and used within a single event loop (one asyncio.run).
+    """
+    def __init__(self, requests_per_minute=60, tokens_per_minute=40_000, max_concurrency=8, max_retries=6):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.lock = asyncio.Lock()
+        self.paused_until = 0.0
+
+    async def acquire(self, tokens):
+        # Les appelants sont servis un par un, dans leur ordre d'arrivée
+        async with self.lock:
+            while True:
+                wait = max(self.paused_until - time.monotonic(),
+                           self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def back_off(self, attempt, error):
+        """
+        Pauses all callers after a 429, for the Retry-After delay when the API gives one,
+        otherwise with an exponential delay and jitter.
+        """
+        retry_after = (getattr(error, 'headers', None) or {}).get('retry-after')
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        print(f"Limite de débit atteinte, nouvel essai dans {delay:.1f}s.")
+
+    async def call(self, make_request, tokens):
+        """
+        Runs 'make_request()' (a coroutine factory) once the budget allows 'tokens' tokens,
+        retrying on 429 up to 'max_retries' times.
+        """
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.acquire(tokens)
+                try:
+                    return await make_request()
+                except openai.error.RateLimitError as error:
+                    if attempt == self.max_retries:
+                        raise
+                    self.back_off(attempt, error)
+
+
+def cached_chat_completion(model, messages, **params):
+    """
+    openai.ChatCompletion.create through the LLM response cache; returns the message content.
+    """
+    def create():
+        response = openai.ChatCompletion.create(model=model, messages=messages, **params)
+        return response['choices'][0]['message']['content']
+
+    return get_llm_cache().cached_call(model, messages, params, create)
+
+
+async def chat_completion(limiter, model, messages, max_tokens=None, expected_completion_tokens=500, **params):
+    """
+    Rate-limited openai.ChatCompletion.acreate; returns the message content.
+    The token budget charged is the prompt size plus max_tokens (or the expected completion size).
+    Cached responses are returned without using the budget.
+    """
+    if max_tokens is not None:
+        params['max_tokens'] = max_tokens
+    tokens = count_message_tokens(messages) + (max_tokens or expected_completion_tokens)
+
+    async def acreate():
+        response = await limiter.call(
+            lambda: openai.ChatCompletion.acreate(model=model, messages=messages, **params), tokens
+        )
+        return response['choices'][0]['message']['content']
+
+    return await get_llm_cache().cached_call_async(model, messages, params, acreate)
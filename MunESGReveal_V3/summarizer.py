@@ -1,5 +1,8 @@
 # summarizer.py
-import openai
+import asyncio
+
+from llm_agent import PAGE_BREAK
+from rate_limiter import RateLimiter, cached_chat_completion, chat_completion
 
 
 def chunk_text(text, chunk_size=2000, overlap=200):
@@ -14,32 +17,110 @@ def chunk_text(text, chunk_size=2000, overlap=200):
         start += chunk_size - overlap
     return chunks
 
-def summarize_chunk(chunk, model="gpt-3.5-turbo", max_tokens=300):
+def summary_messages(chunk):
     """
-    Utilise l'API OpenAI pour résumer un segment de texte.
+    Messages demandant le résumé d'un segment de texte.
     """
     system_prompt = (
         "Vous êtes un assistant AI spécialisé dans la synthèse de documents municipaux en français. "
         "Veuillez résumer de manière concise le texte suivant."
     )
     user_prompt = f"Texte à résumer:\n\n{chunk}\n\nRésumé concis:"
-    response = openai.ChatCompletion.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.0,
-        max_tokens=max_tokens
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def reduce_messages(summaries):
+    """
+    Messages demandant de fusionner des résumés partiels consécutifs en un seul résumé.
+    """
+    system_prompt = (
+        "Vous êtes un assistant AI spécialisé dans la synthèse de documents municipaux en français. "
+        "Veuillez fusionner les résumés partiels suivants, dans leur ordre, en un résumé concis "
+        "qui conserve les chiffres, les engagements et les noms propres."
     )
-    return response['choices'][0]['message']['content'].strip()
+    user_prompt = f"Résumés partiels:\n\n{summaries}\n\nRésumé fusionné:"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def summarize_chunk(chunk, model="gpt-3.5-turbo", max_tokens=300):
+    """
+    Utilise l'API OpenAI pour résumer un segment de texte.
+    """
+    return cached_chat_completion(model, summary_messages(chunk), temperature=0.0, max_tokens=max_tokens).strip()
 
-def summarize_text(full_text, chunk_size=2000, overlap=200, model="gpt-3.5-turbo"):
+def group_summaries(summaries, chunk_size):
     """
-    Découpe et résume un texte long en combinant les résumés de chaque segment.
+    Regroupe des résumés consécutifs en groupes d'au plus 'chunk_size' caractères.
     """
-    chunks = chunk_text(full_text, chunk_size, overlap)
-    summaries = []
-    for chunk in chunks:
-        summaries.append(summarize_chunk(chunk, model=model))
-    return "\n".join(summaries)
+    groups, group = [], []
+    for part in summaries:
+        if group and len("\n".join(group + [part])) > chunk_size:
+            groups.append(group)
+            group = []
+        group.append(part)
+    if group:
+        groups.append(group)
+    return groups
+
+def split_by_counts(items, counts):
+    """
+    Découpe 'items' en listes consécutives de longueurs 'counts'.
+    """
+    parts, start = [], 0
+    for count in counts:
+        parts.append(list(items[start:start + count]))
+        start += count
+    return parts
+
+async def summarize_text_async(full_text, limiter, chunk_size=2000, overlap=200, model="gpt-3.5-turbo",
+                               max_tokens=300, max_summary_chars=None, max_reduce_rounds=3):
+    """
+    Map-reduce : résume tous les segments en parallèle (dans les limites du 'limiter'), puis,
+    si 'max_summary_chars' est donné et que le résumé joint le dépasse, fusionne les résumés
+    par groupes consécutifs jusqu'à passer sous la cible.
+    Les pages séparées par PAGE_BREAK sont résumées chacune à part et le résumé garde ces
+    séparateurs, pour que split_document retrouve les numéros de page ; un groupe ne mélange
+    donc jamais deux pages. Les résumés sont toujours joints dans l'ordre du texte.
+    """
+    async def complete(messages):
+        content = await chat_completion(limiter, model, messages, max_tokens=max_tokens, temperature=0.0)
+        return content.strip()
+
+    def join(page_summaries):
+        return PAGE_BREAK.join("\n".join(summaries) for summaries in page_summaries)
+
+    # Map : asyncio.gather rend les résumés dans l'ordre des segments, page après page
+    page_chunks = [chunk_text(page, chunk_size, overlap) if page.strip() else [] for page in full_text.split(PAGE_BREAK)]
+    summaries = await asyncio.gather(*(complete(summary_messages(chunk)) for chunks in page_chunks for chunk in chunks))
+    page_summaries = split_by_counts(summaries, [len(chunks) for chunks in page_chunks])
+    summary = join(page_summaries)
+
+    # Reduce : groupes de résumés consécutifs d'une même page, d'au plus 'chunk_size' caractères
+    for _ in range(max_reduce_rounds):
+        if not max_summary_chars or len(summary) <= max_summary_chars:
+            break
+        page_groups = [group_summaries(summaries, chunk_size) for summaries in page_summaries]
+        if sum(map(len, page_groups)) == sum(map(len, page_summaries)):
+            break  # Chaque résumé remplit déjà un groupe : une fusion ne réduirait rien
+        merged = await asyncio.gather(*(complete(reduce_messages("\n".join(group)))
+                                        for groups in page_groups for group in groups))
+        page_summaries = split_by_counts(merged, [len(groups) for groups in page_groups])
+        summary = join(page_summaries)
+    return summary
+
+def summarize_text(full_text, chunk_size=2000, overlap=200, model="gpt-3.5-turbo", max_summary_chars=None,
+                   requests_per_minute=200, tokens_per_minute=90_000, max_concurrency=8):
+    """
+    Découpe et résume un texte long en combinant les résumés de chaque segment,
+    résumés en parallèle dans les limites de requêtes et de tokens par minute.
+    """
+    async def run():
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_concurrency)
+        return await summarize_text_async(full_text, limiter, chunk_size, overlap, model,
+                                          max_summary_chars=max_summary_chars)
+
+    return asyncio.run(run())
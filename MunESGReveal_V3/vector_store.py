@@ -0,0 +1,101 @@
+# vector_store.py
+import hashlib
+import json
+import os
+import tempfile
+
+import faiss
+import numpy as np
+
+
+def chunk_hash(text, model):
+    """
+    Content hash of a chunk; the embedding model is part of the key so that
+    changing model never reuses stale vectors.
+    """
+    return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+
+def _replace_atomically(path, write):
+    """
+    Writes through 'write(file)' into a temporary file, then moves it over 'path'.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        write(file)
+    os.replace(tmp_path, path)
+
+
+class VectorStore:
+    """
+    Chunk texts, chunk metadata, embeddings and FAISS index saved in one directory.
+    Rows of the embedding matrix and of the index follow the order of 'chunks'.
+    """
+    def __init__(self, directory, model):
+        self.directory = directory
+        self.model = model
+        self.chunks = []  # [{'hash': ..., 'text': ..., 'metadata': {...}}]
+        self.embeddings = None
+        self.index_mode = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        """
+        Loads the chunks and embeddings saved on disk. A missing, partial or
+        other-model store is treated as empty.
+        """
+        self.chunks, self.embeddings, self.index_mode = [], None, None
+        try:
+            with open(self.path('chunks.json'), 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            embeddings = np.load(self.path('embeddings.npy'))
+        except (OSError, ValueError):
+            return
+        if (saved.get('model') == self.model and len(saved['chunks']) == len(embeddings)
+                and saved.get('embeddings_sha256') == hashlib.sha256(embeddings.tobytes()).hexdigest()):
+            self.chunks, self.embeddings = saved['chunks'], embeddings.astype(np.float32, copy=False)
+            self.index_mode = saved.get('index_mode')
+
+    def read_index(self, index_mode):
+        """
+        Returns the saved FAISS index, or None when it is missing, of another mode
+        or out of step with the chunks.
+        """
+        if not self.chunks or self.index_mode != index_mode or not os.path.exists(self.path('index.faiss')):
+            return None
+        index = faiss.read_index(self.path('index.faiss'))
+        return index if index.ntotal == len(self.chunks) else None
+
+    def save(self, chunks, embeddings, index, index_mode):
+        """
+        Replaces the saved store. The chunk list is written last and carries the
+        digest of the embeddings it describes, so an interrupted save is detected on load.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        _replace_atomically(self.path('embeddings.npy'), lambda file: np.save(file, embeddings))
+        _replace_atomically(self.path('index.faiss'),
+                            lambda file: file.write(faiss.serialize_index(index).tobytes()))
+        payload = json.dumps({'model': self.model, 'chunks': chunks, 'index_mode': index_mode,
+                              'embeddings_sha256': hashlib.sha256(embeddings.tobytes()).hexdigest()},
+                             ensure_ascii=False).encode('utf-8')
+        _replace_atomically(self.path('chunks.json'), lambda file: file.write(payload))
+        self.chunks, self.embeddings, self.index_mode = chunks, embeddings, index_mode
+
+    def load_query_embeddings(self):
+        """
+        Returns {query hash: embedding} for the queries embedded in previous runs.
+        """
+        try:
+            with np.load(self.path('query_embeddings.npz')) as saved:
+                return dict(zip(saved['hashes'].tolist(), saved['embeddings'].astype(np.float32, copy=False)))
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def save_query_embeddings(self, query_embeddings):
+        os.makedirs(self.directory, exist_ok=True)
+        hashes = np.array(list(query_embeddings))
+        embeddings = np.stack(list(query_embeddings.values()))
+        _replace_atomically(self.path('query_embeddings.npz'),
+                            lambda file: np.savez(file, hashes=hashes, embeddings=embeddings))
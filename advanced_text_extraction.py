@@ -4,13 +4,15 @@ import re
 import time
 
 import pandas as pd
-import PyPDF2
 import tiktoken
 from langchain.chat_models import ChatOpenAI
 from langchain.text_splitter import TokenTextSplitter
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from llm_cache import get_llm_cache
+from text_cache import get_ocr_texts, get_page_texts
+
 # Configuration
 openai_api_key = "put your key here"  
 model = ChatOpenAI(model="gpt-4", temperature=0, openai_api_key=openai_api_key)
@@ -133,25 +135,29 @@ Consignes :
 
 # ====================== PDF Reading Function ======================
 def read_pdf(pdf_path):
-    """Extract text from PDF with OCR fallback"""
+    """Extract text from PDF, OCR'ing only the pages without a text layer"""
     try:
-        text = ""
-        with open(pdf_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() or ""  # Handle None returns
-            
-        # Fallback to OCR if text extraction fails
-        if len(text.strip()) < 100:
+        # Page texts come from the shared on-disk cache, keyed by the PDF content hash
+        page_texts = list(get_page_texts(pdf_path))
+
+        # OCR fallback for scanned pages only, one page image in memory at a time;
+        # pages with a digital text layer keep their text, and a page whose OCR fails
+        # (missing poppler or tesseract, unreadable page) keeps its digital text
+        scanned = [i for i, text in enumerate(page_texts, start=1) if not text.strip()]
+        ocr_count = 0
+        for page_number in scanned:
             try:
-                import pytesseract
-                from pdf2image import convert_from_bytes
-                images = convert_from_bytes(open(pdf_path, "rb").read())
-                text = "\n".join([pytesseract.image_to_string(img) for img in images])
+                page_texts[page_number - 1] = get_ocr_texts(pdf_path, [page_number], lang="eng", dpi=200)[page_number]
+                ocr_count += 1
             except ImportError:
                 print("Install pdf2image and pytesseract for OCR support")
-                
-        return text
+                break
+            except Exception as e:
+                print(f"OCR error on page {page_number}: {str(e)}")
+        if ocr_count:
+            print(f"OCR applied to {ocr_count}/{len(page_texts)} pages")
+
+        return "\n".join(page_texts)
     
     except Exception as e:
         print(f"PDF reading error: {str(e)}")
@@ -164,10 +170,12 @@ def extract_keyword_values(pdf_path):
     all_results = []
     for idx, chunk in enumerate(chunks):
         print(f"Processing chunk {idx+1}/{len(chunks)}")
+        hits = get_llm_cache().hits
         result = process_chunk(chunk)
         if result and 'donnees' in result:
             all_results.extend(result['donnees'])
-        time.sleep(0.5)
+        if get_llm_cache().hits == hits:
+            time.sleep(0.5)  # Pause only after a real API call
     
     return pd.DataFrame(all_results).drop_duplicates(
         subset=['categorie', 'mot_cle', 'contexte'],
@@ -178,7 +186,7 @@ def extract_keyword_values(pdf_path):
 def process_chunk(chunk):
     """Process text chunk with GPT-4"""
     try:
-        response = model.invoke([
+        messages = [
             SystemMessage(content=f"""
             Tu es un expert en extraction de données quantitatives.
 
@@ -213,8 +221,15 @@ Consignes :
 }}
 """),
             HumanMessage(content=f"Texte:\n{chunk[:6000]}")
-        ])
-        return parse_response(response)
+        ]
+        # Same model, prompt and temperature 0: the cached answer is reused
+        content = get_llm_cache().cached_call(
+            model.model_name,
+            [{"role": message.type, "content": message.content} for message in messages],
+            {"temperature": model.temperature},
+            lambda: model.invoke(messages).content
+        )
+        return parse_response(AIMessage(content=content))
     except Exception as e:
         print(f"Chunk processing error: {str(e)}")
         return None
@@ -244,6 +259,7 @@ def main(folder_path):
             df["fichier"] = file
             all_results.append(df)
 
+    print(f"Cache des réponses LLM : {get_llm_cache().stats()}")
     final_df = pd.concat(all_results, ignore_index=True)
     output_path = os.path.join(folder_path, "résultats_quantitatifs_text.csv")
     final_df.to_csv(output_path, index=False)
@@ -1,14 +1,27 @@
+import bisect
 import os
 import re
 import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import pandas as pd
-import PyPDF2
+import torch
 from openpyxl.utils.exceptions import IllegalCharacterError
 from transformers import (AutoModelForSequenceClassification, AutoTokenizer,
                           pipeline)
 
+from text_cache import get_page_texts
+
+try:
+    import ahocorasick  # pyahocorasick: optional, C implementation of the automaton
+except ImportError:
+    ahocorasick = None
+
+# Without pyahocorasick, per-keyword str.find loops (run in C) are faster than the
+# pure-Python automaton below this many keywords (see benchmark_keyword_matcher.py)
+AUTOMATON_MIN_KEYWORDS = 400
+
 
 # Function to extract phrases with the keyword approximately in the middle from a long context
 def extract_keyword_phrase_centered(context, keyword, start_index, span=50):
@@ -38,6 +51,60 @@ def extract_keyword_phrase_centered(context, keyword, start_index, span=50):
     return ' '.join(final_words).strip()
 
 
+class PageWordIndex:
+    """
+    Whitespace-separated words of a page with their character offsets.
+    Built once per page, so that each context window around a keyword hit is a slice
+    of the word list instead of a re-split of the text before and after the hit.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.words = []
+        self.starts = []
+        self.ends = []
+        for match in re.finditer(r'\S+', text):
+            self.words.append(match.group())
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+
+    def keyword_phrase_centered(self, keyword, keyword_index, span=50):
+        """
+        Same snippet as extract_keyword_phrase_centered for a hit already located at 'keyword_index'.
+        """
+        text = self.text
+        words = self.words
+        keyword_end = keyword_index + len(keyword)
+
+        # Words entirely before the keyword, plus the part of a word cut by the keyword start
+        full_before = bisect.bisect_right(self.ends, keyword_index)
+        before_tail = []
+        if full_before < len(words) and self.starts[full_before] < keyword_index:
+            before_tail = [text[self.starts[full_before]:keyword_index]]
+
+        # Words entirely after the keyword, preceded by the part of a word cut by the keyword end
+        full_after = bisect.bisect_left(self.starts, keyword_end)
+        after_head = []
+        if full_after > 0 and self.ends[full_after - 1] > keyword_end:
+            after_head = [text[keyword_end:self.ends[full_after - 1]]]
+
+        words_before_count = full_before + len(before_tail)
+        words_after_count = len(words) - full_after + len(after_head)
+        keyword_words = keyword.split()
+
+        # Word window bounds, computed exactly as in extract_keyword_phrase_centered
+        start = max(words_before_count - span, 0)
+        end = min(words_before_count + len(keyword_words) + span, words_before_count + words_after_count)
+        after_limit = end - words_before_count - len(keyword_words)
+        if after_limit < 0:  # Negative slice bound: drops words from the end of the list
+            after_limit = max(words_after_count + after_limit, 0)
+
+        before_candidates = words[max(full_before - span, 0):full_before] + before_tail
+        final_before = before_candidates[len(before_candidates) - (words_before_count - start):]
+        final_after = (after_head + words[full_after:full_after + after_limit])[:after_limit]
+
+        return ' '.join(final_before + keyword_words + final_after).strip()
+
+
 def rename_corrupted_pdf(pdf_path):
     directory, filename = os.path.split(pdf_path)
     new_filename = f"corrupted_{filename}"
@@ -45,47 +112,182 @@ def rename_corrupted_pdf(pdf_path):
     os.rename(pdf_path, new_pdf_path)
     return new_pdf_path
 
-# Function to count occurrences of each keyword and extract context where they appear
-def count_keywords_in_pdf(pdf_path, keywords):
+class KeywordMatcher:
+    """
+    Finds the occurrences of many lower-cased keywords in a page.
+    Backends:
+    - 'ahocorasick': the pyahocorasick automaton, one linear scan in C (used when installed);
+    - 'automaton': the same Aho-Corasick automaton in pure Python, one linear scan of the text;
+    - 'find': one str.find loop per keyword, faster than 'automaton' for smaller keyword lists.
+    All backends return the same occurrences.
+    """
+    def __init__(self, keywords, backend=None):
+        # An empty keyword would match everywhere
+        self.keywords_lower = list(dict.fromkeys(keyword.lower() for keyword in keywords if keyword))
+        if backend is None:
+            if ahocorasick is not None:
+                backend = 'ahocorasick'
+            elif len(self.keywords_lower) >= AUTOMATON_MIN_KEYWORDS:
+                backend = 'automaton'
+            else:
+                backend = 'find'
+        self.backend = backend
+
+        if backend == 'ahocorasick':
+            self.automaton = ahocorasick.Automaton()
+            for keyword_lower in self.keywords_lower:
+                self.automaton.add_word(keyword_lower, keyword_lower)
+            if self.keywords_lower:
+                self.automaton.make_automaton()
+        elif backend == 'automaton':
+            self.goto = [{}]
+            self.fail = [0]
+            self.output = [[]]
+            for keyword_lower in self.keywords_lower:
+                self._add(keyword_lower)
+            self._build()
+        elif backend != 'find':
+            raise ValueError(f"Unknown matcher backend: {backend}")
+
+    def _add(self, keyword_lower):
+        state = 0
+        for char in keyword_lower:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        if keyword_lower not in self.output[state]:
+            self.output[state].append(keyword_lower)
+
+    def _build(self):
+        # Breadth-first pass to compute failure links and merge outputs along them
+        # (children of the root keep their failure link to the root)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def finditer(self, text_lower):
+        """
+        Yields (start_index, keyword_lower) for every occurrence, overlapping ones included,
+        ordered by end position ('ahocorasick' and 'automaton' backends).
+        """
+        if self.backend == 'ahocorasick':
+            if self.keywords_lower:
+                for end_index, keyword_lower in self.automaton.iter(text_lower):
+                    yield end_index - len(keyword_lower) + 1, keyword_lower
+            return
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text_lower):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword_lower in output[state]:
+                yield index - len(keyword_lower) + 1, keyword_lower
+
+    def find_all(self, text_lower, keywords_lower=None):
+        """
+        Returns {keyword_lower: [start_index, ...]} with the same non-overlapping,
+        left-to-right occurrences that repeated str.find calls would return for each keyword.
+        """
+        hits = defaultdict(list)
+        if self.backend == 'find':
+            for keyword_lower in self.keywords_lower:
+                if keywords_lower is not None and keyword_lower not in keywords_lower:
+                    continue
+                start_index = text_lower.find(keyword_lower)
+                while start_index != -1:
+                    hits[keyword_lower].append(start_index)
+                    start_index = text_lower.find(keyword_lower, start_index + len(keyword_lower))
+            return hits
+
+        next_start = {}
+        for start_index, keyword_lower in self.finditer(text_lower):
+            if keywords_lower is not None and keyword_lower not in keywords_lower:
+                continue
+            if start_index < next_start.get(keyword_lower, 0):
+                continue  # Overlaps the previous occurrence of the same keyword
+            hits[keyword_lower].append(start_index)
+            next_start[keyword_lower] = start_index + len(keyword_lower)
+        return hits
+
+
+def build_keyword_matcher(keywords_dict):
+    """
+    Compiles a single KeywordMatcher from every keyword of every category.
+    """
+    return KeywordMatcher(keyword for keywords in keywords_dict.values() for keyword in keywords)
+
+
+# Function to extract the text of every page of a PDF, parsing the file only once
+def extract_page_texts(pdf_path):
+    try:
+        # Shared on-disk cache: the PDF is only parsed the first time its content is seen
+        page_texts = get_page_texts(pdf_path)
+    except:
+        corrupted_pdf_path = rename_corrupted_pdf(pdf_path)
+        print(f"Error reading {pdf_path}: EOF marker not found. Renamed to {corrupted_pdf_path}. Skipping this file.")
+        return []
+    return page_texts
+
+
+# Function to count occurrences of each keyword and extract context where they appear,
+# given the page texts and the matcher hits of each page
+def count_keywords_in_pages(page_texts, keywords, page_hits):
     count = defaultdict(lambda: defaultdict(lambda: {'count': 0, 'contexts': []}))
 
-    with open(pdf_path, 'rb') as file:
-        try:
-            reader = PyPDF2.PdfReader(file)
-            for page_number, page in enumerate(reader.pages, start=1):  # Start counting pages from 1
-                text = page.extract_text() if page.extract_text() else ''
-                text_lower = text.lower()  # Convert text to lower case for case-insensitive search
-
-                for keyword in keywords:
-                    keyword_lower = keyword.lower()  # Convert keyword to lower case as well
-                    start = 0  # Start position for finding keywords in the text
-                    while True:
-                        start_index = text_lower.find(keyword_lower, start)  # Find the keyword starting from 'start'
-                        if start_index == -1:  # Break the loop if no more keywords are found
-                            break
-                        # Update count
-                        count[keyword_lower][page_number]['count'] += 1
-                        # Extract and add context for this keyword occurrence
-                        extracted_context = extract_keyword_phrase_centered(text, keyword, start_index)  # You need to modify extract function if it requires start_index
-                        count[keyword_lower][page_number]['contexts'].append(extracted_context)
-                        start = start_index + len(keyword_lower)  # Move start to just after this occurrence
-        except:
-            corrupted_pdf_path = rename_corrupted_pdf(pdf_path)
-            print(f"Error reading {pdf_file}: EOF marker not found. Renamed to {corrupted_pdf_path}. Skipping this file.")
-                    
+    for page_number, (text, hits) in enumerate(zip(page_texts, page_hits), start=1):  # Start counting pages from 1
+        word_index = None
+        for keyword in keywords:
+            keyword_lower = keyword.lower()
+            for start_index in hits.get(keyword_lower, []):
+                if word_index is None:  # Index the page words only if it has hits
+                    word_index = PageWordIndex(text)
+                # Update count
+                count[keyword_lower][page_number]['count'] += 1
+                # Extract and add context for this keyword occurrence
+                extracted_context = word_index.keyword_phrase_centered(keyword, start_index)
+                count[keyword_lower][page_number]['contexts'].append(extracted_context)
+
     return count
 
 
+# Function to count occurrences of each keyword and extract context where they appear
+def count_keywords_in_pdf(pdf_path, keywords, matcher=None):
+    if matcher is None:
+        matcher = KeywordMatcher(keywords)
+    page_texts = extract_page_texts(pdf_path)
+    # One scan of each page finds the occurrences of all keywords
+    page_hits = [matcher.find_all(text.lower()) for text in page_texts]
+    return count_keywords_in_pages(page_texts, keywords, page_hits)
+
+
 
 # Function to go through all categories
-def count_all_categories(pdf_path, lists_dict):
+def count_all_categories(pdf_path, lists_dict, page_texts=None):
     total_counts = {}
+    # Parse the PDF once and scan each page once for the whole dictionary,
+    # then share the hits between all categories
+    if page_texts is None:
+        page_texts = extract_page_texts(pdf_path)
+    matcher = build_keyword_matcher(lists_dict)
+    page_hits = [matcher.find_all(text.lower()) for text in page_texts]
     for category, keywords in lists_dict.items():
-        counts = count_keywords_in_pdf(pdf_path, keywords)
+        counts = count_keywords_in_pages(page_texts, keywords, page_hits)
         # Convert nested counts into a readable format
         formatted_counts = {}
         for keyword in keywords:  # Change here: iterate through all provided keywords
-            keyword_lower = keyword.lower()  # Match the case used in count_keywords_in_pdf
+            keyword_lower = keyword.lower()  # Match the case used in count_keywords_in_pages
             # If keyword was found in the text
             if keyword_lower in counts:
                 pages_detail = {}
@@ -102,27 +304,43 @@ def count_all_categories(pdf_path, lists_dict):
     
     return total_counts
 
-def apply_sentiment_analysis(df, text_column):
-    # Load tokenizer and model
-    tokenizer = AutoTokenizer.from_pretrained("distilbert-base-uncased-finetuned-sst-2-english")
-    model = AutoModelForSequenceClassification.from_pretrained("distilbert-base-uncased-finetuned-sst-2-english")
-    
-    # Create a sentiment analysis pipeline with explicit tokenizer and model
-    sentiment_pipeline = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer, truncation=True)
-    
-    # Function to apply sentiment analysis, now with tokenizer handling truncation
-    def analyze_sentiment(text):
-        if text == 'N/A':  # Check if context is 'N/A'
-            return 'N/A', 'N/A'  # Return 'N/A' for both label and score
-        else:
-            result = sentiment_pipeline(text)
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+_sentiment_pipeline = None
+
+
+def get_sentiment_pipeline():
+    """
+    Loads the sentiment tokenizer and model once per process and reuses the pipeline afterwards.
+    """
+    global _sentiment_pipeline
+    if _sentiment_pipeline is None:
+        # Load tokenizer and model
+        tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_MODEL)
+        model = AutoModelForSequenceClassification.from_pretrained(SENTIMENT_MODEL)
+
+        # Create a sentiment analysis pipeline with explicit tokenizer and model
+        _sentiment_pipeline = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer, truncation=True)
+    return _sentiment_pipeline
+
+
+def apply_sentiment_analysis(df, text_column, batch_size=32):
+    sentiment_pipeline = get_sentiment_pipeline()
+
+    # Score each distinct context only once: overlapping keywords often produce the same snippet
+    unique_texts = [text for text in dict.fromkeys(df[text_column]) if text != 'N/A']
+    # Batch texts of similar length together to limit padding
+    unique_texts.sort(key=len)
+
+    sentiments = {'N/A': ('N/A', 'N/A')}  # Return 'N/A' for both label and score
+    if unique_texts:
+        results = sentiment_pipeline(unique_texts, batch_size=batch_size)
+        for text, result in zip(unique_texts, results):
             # Extract label and score from the result
-            label = result[0]['label']
-            score = result[0]['score']
-            return label, score
-    
-    # Apply sentiment analysis to each row of the dataframe
-    df['sentiment_label'], df['sentiment_score'] = zip(*df[text_column].apply(analyze_sentiment))
+            sentiments[text] = (result['label'], result['score'])
+
+    # Map the results back onto every row of the dataframe
+    df['sentiment_label'] = [sentiments[text][0] for text in df[text_column]]
+    df['sentiment_score'] = [sentiments[text][1] for text in df[text_column]]
     return df
 
 
@@ -139,8 +357,9 @@ def clean_illegal_characters(text):
 def text_analysis_context_sentiment(folder_path, pdf_path, keywords_dict):
     start_time = time.time()  # Record the start time
 
-    # Get the counts for all categories
-    all_counts = count_all_categories(pdf_path, keywords_dict)
+    # Extract the page texts once, then get the counts for all categories from them
+    page_texts = extract_page_texts(pdf_path)
+    all_counts = count_all_categories(pdf_path, keywords_dict, page_texts)
     
     # Prepare data for DataFrame with context adjustment
     data = []
@@ -255,3 +474,75 @@ def process_pdfs_in_folder(folder_path, keywords_dict):
         elapsed_time = time.time() - start_time
         print(f"Processed {pdf_file} in {elapsed_time:.2f} seconds")
 
+
+
+# Function run once in each worker process of the corpus pool, so the model stays resident;
+# each worker gets its share of the cores instead of one PyTorch thread per core
+def init_analysis_worker(torch_threads=1):
+    torch.set_num_threads(torch_threads)
+    get_sentiment_pipeline()
+
+# Function to analyse one PDF inside a worker process; failures stay confined to this task
+def analyse_pdf_task(munnom, folder_path, pdf_path, keywords_dict):
+    start_time = time.time()
+    error = None
+    try:
+        text_analysis_context_sentiment(folder_path, pdf_path, keywords_dict)
+    except Exception as e:
+        error = str(e)
+        if os.path.exists(pdf_path):
+            corrupted_pdf_path = rename_corrupted_pdf(pdf_path)
+            print(f"Error reading {pdf_path}: {e}. Renamed to {corrupted_pdf_path}. Skipping this file.")
+    return munnom, os.path.basename(pdf_path), time.time() - start_time, error
+
+# Function to analyse the PDFs of every municipality with a process pool
+def process_corpus(municipalities, keywords_dict, base_directory='pdfs_downloaded_filter', max_workers=None):
+    tasks = []
+    for munnom in municipalities:
+        folder_path = os.path.join(base_directory, munnom)
+        if not os.path.isdir(folder_path):
+            print(f"No folder found for {munnom}")
+            continue
+        for pdf_file in os.listdir(folder_path):
+            if not pdf_file.endswith('.pdf'):
+                continue
+            pdf_path = os.path.join(folder_path, pdf_file)
+            base_name = os.path.splitext(pdf_file)[0]
+            excel_path = os.path.join(folder_path, f'{base_name}.xlsx')
+            # Skip files already analysed; no pop-up here, the message only goes to alert.txt
+            if os.path.exists(excel_path):
+                save_info(f"The file {excel_path} already exists.", folder_path)
+                continue
+            tasks.append((os.path.getsize(pdf_path), munnom, folder_path, pdf_path))
+
+    # Largest PDFs first, so a big report does not start last and hold the whole run
+    tasks.sort(key=lambda task: task[0], reverse=True)
+
+    start_time = time.time()
+    timings = {munnom: {'pdfs': 0, 'failed': 0, 'cpu_seconds': 0.0, 'finished_after': 0.0}
+               for munnom in dict.fromkeys(task[1] for task in tasks)}
+    workers = max_workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_analysis_worker,
+                             initargs=(max(1, os.cpu_count() // workers),)) as executor:
+        futures = {executor.submit(analyse_pdf_task, munnom, folder_path, pdf_path, keywords_dict): (munnom, pdf_path)
+                   for _, munnom, folder_path, pdf_path in tasks}
+        for future in as_completed(futures):
+            munnom, pdf_path = futures[future]
+            try:
+                _, pdf_file, elapsed_time, error = future.result()
+            except Exception as e:  # The worker itself died on this file
+                pdf_file, elapsed_time, error = os.path.basename(pdf_path), 0.0, str(e)
+            timings[munnom]['pdfs'] += 1
+            timings[munnom]['cpu_seconds'] += elapsed_time
+            timings[munnom]['finished_after'] = time.time() - start_time
+            if error:
+                timings[munnom]['failed'] += 1
+                print(f"Failed {munnom}/{pdf_file}: {error}")
+            else:
+                print(f"Processed {munnom}/{pdf_file} in {elapsed_time:.2f} seconds")
+
+    for munnom, timing in timings.items():
+        print(f"Time taken for {munnom}: {timing['pdfs']} PDFs ({timing['failed']} failed), "
+              f"{timing['cpu_seconds']:.2f} seconds of work, done after {timing['finished_after']:.2f} seconds")
+    print(f"Corpus analysed in {time.time() - start_time:.2f} seconds")
+    return timings
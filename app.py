@@ -1,12 +1,11 @@
 import os
-import shutil
 import time
 
 import pandas as pd
 import streamlit as st
 
-from analysis import process_pdfs_in_folder
-from downloadQuali import download_pdfs_from_url
+from analysis import process_corpus, process_pdfs_in_folder
+from downloadQuali import download_all_municipalities, download_pdfs_from_url
 from downloadQuanti import download_and_process_census_data
 from utilities import (construct_file_path, construct_file_path_analyse,
                        get_file_creation_time, get_folder_creation_time,
@@ -194,34 +193,16 @@ elif section == "Télécharger":
             df = pd.read_csv(excel_path)
             keywords = ['rapport', 'annuel', 'plan', 'stratégie', 'finance', 'urbanisme', 'budget', 'politique', 'bilan']
         
-            for index, row in df.iterrows():
-                skipped_files_info = []
-                munnom = row['munnom']
-                mweb_url = 'https://' + row['mweb'] if not row['mweb'].startswith('http') else row['mweb']
-    
-                print(f"Start downloading for {munnom}")
-                st.write(f"Début du téléchargement pour {munnom}")
-
-                munnom_directory = f'pdfs_downloaded_filter/{row["munnom"]}'  # Directory name based on 'munnom' column
-
-                if os.path.exists(munnom_directory):
-                    # Delete the existing directory
-                    shutil.rmtree(munnom_directory)
-                    # Create a new empty directory
-                    os.makedirs(munnom_directory)
-
-                visited_urls = set()
-                downloaded_pdfs = set()
-                start_time = time.time()
-                download_pdfs_from_url(munnom, mweb_url, munnom_directory, visited_urls, downloaded_pdfs, skipped_files_info, keywords)
-                print(f"Time taken for {munnom}: {time.time() - start_time} seconds")
-                
-                st.write(f"Téléchargement terminé pour {munnom}")
-                st.write(f"Temps écoulé pour {munnom}: {time.time() - start_time} secondes")
-
-                df_skipped = pd.DataFrame(skipped_files_info)
-                excel_file_path = os.path.join(munnom_directory, 'skipped_files_info.xlsx')
-                df_skipped.to_excel(excel_file_path, index=False)
+            # All municipalities are crawled at once, with global and per-host connection limits
+            def report_progress(munnom, stats):
+                st.write(f"Téléchargement terminé pour {munnom}: {stats['pdfs']} PDFs, {stats['pages']} pages "
+                         f"({stats['pages_per_second']:.2f} pages/s)")
+                st.write(f"Temps écoulé pour {munnom}: {stats['seconds']:.2f} secondes")
+
+            start_time = time.time()
+            download_all_municipalities(df, keywords, base_directory='pdfs_downloaded_filter',
+                                        progress_callback=report_progress)
+            st.write(f"Temps écoulé pour toutes les municipalités: {time.time() - start_time:.2f} secondes")
 
     # Subsection 5: telechargement donnees quantitatives
     with st.expander("Voulez-vous retélécharger les données  quantitatives?"):
@@ -323,14 +304,13 @@ elif section == "Analyse":
             # Convert the DataFrame to a dictionary
             keywords_dict = {row['Category']: row['Keywords'].split('; ') for _, row in dfKey.iterrows()}
 
-            for index, row in df.iterrows():
-                print(f"Start analysis for {row['munnom']}")
-                munnom_directory = f'pdfs_downloaded_filter/{row["munnom"]}' 
-                start_time = time.time()  
-                process_pdfs_in_folder(munnom_directory, keywords_dict)
-                end_time = time.time()  
-                time_taken = end_time - start_time 
-                print(f"Time taken for {row['munnom']} : {time_taken} seconds")  
+            # Every PDF of every municipality goes to a process pool, largest files first
+            start_time = time.time()
+            timings = process_corpus(df['munnom'].unique(), keywords_dict, base_directory='pdfs_downloaded_filter')
+            for munnom, timing in timings.items():
+                st.write(f"{munnom}: {timing['pdfs']} PDFs analysés ({timing['failed']} en échec), "
+                         f"terminé après {timing['finished_after']:.2f} secondes")
+            st.write(f"Temps écoulé pour toutes les municipalités: {time.time() - start_time:.2f} secondes")
 
 elif section == "Analyse avancée":
     st.title("Analyse avancée")
@@ -0,0 +1,69 @@
+import random
+import sys
+import time
+
+from analysis import KeywordMatcher, ahocorasick
+
+
+def naive_find_all(text_lower, keywords):
+    """
+    Reference implementation: one str.find loop per keyword, as count_keywords_in_pdf used to do.
+    """
+    hits = {}
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        start = 0
+        while True:
+            start_index = text_lower.find(keyword_lower, start)
+            if start_index == -1:
+                break
+            hits.setdefault(keyword_lower, []).append(start_index)
+            start = start_index + len(keyword_lower)
+    return hits
+
+
+def make_keywords(n, vocabulary):
+    """
+    Builds n distinct keywords of one to three words taken from the vocabulary.
+    """
+    keywords = set()
+    while len(keywords) < n:
+        keywords.add(' '.join(random.sample(vocabulary, random.randint(1, 3))))
+    return list(keywords)
+
+
+def benchmark_keyword_matcher(keyword_counts=(10, 50, 100, 200, 400, 800), pages=50, words_per_page=500):
+    """
+    Prints the scan time of each KeywordMatcher backend and of the per-keyword find loop
+    as the number of keywords grows, over the same synthetic pages.
+    The crossing point of 'automaton' and 'find' sets AUTOMATON_MIN_KEYWORDS.
+    """
+    backends = ['automaton', 'find'] + (['ahocorasick'] if ahocorasick is not None else [])
+    random.seed(0)
+    vocabulary = [f"mot{i}" for i in range(2000)]
+    page_texts = [' '.join(random.choices(vocabulary, k=words_per_page)) for _ in range(pages)]
+
+    print(f"{'keywords':>10}" + "".join(f" {backend + ' (s)':>16}" for backend in backends) + f" {'find loop (s)':>14}")
+    for n in keyword_counts:
+        keywords = make_keywords(n, vocabulary)
+
+        start_time = time.time()
+        naive_hits = [naive_find_all(text.lower(), keywords) for text in page_texts]
+        naive_time = time.time() - start_time
+
+        backend_times = []
+        for backend in backends:
+            start_time = time.time()
+            matcher = KeywordMatcher(keywords, backend=backend)
+            matcher_hits = [matcher.find_all(text.lower()) for text in page_texts]
+            backend_times.append(time.time() - start_time)
+            assert [dict(h) for h in matcher_hits] == naive_hits, f"{backend} and find loop disagree"
+
+        print(f"{n:>10}" + "".join(f" {t:>16.3f}" for t in backend_times) + f" {naive_time:>14.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_keyword_matcher(pages=int(sys.argv[1]))
+    else:
+        benchmark_keyword_matcher()
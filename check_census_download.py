@@ -0,0 +1,95 @@
+import functools
+import os
+import sys
+import tempfile
+import threading
+import zipfile
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import downloadQuanti
+from downloadQuanti import CENSUS_MEMBER, download_and_process_census_data
+
+CENSUS_HEADER = ['NIVEAU_GÉO', 'NOM_GÉO', 'NOM_CARACTÉRISTIQUE', 'C1_CHIFFRE_TOTAL', 'C2_CHIFFRE_HOMMES+']
+CHARACTERISTICS = [('Population, 2021', '{population}'), ('Revenu médian', 'x'), ('Âge moyen', '41.2')]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def build_stand_in_archive(zip_path, towns):
+    """
+    Writes a small census ZIP: the data CSV, plus a decoy CSV with wrong values and a
+    metadata file, placed first so that picking the wrong member shows in the output.
+    """
+    rows = [CENSUS_HEADER]
+    for i, town in enumerate(towns):
+        for characteristic, value in CHARACTERISTICS:
+            rows.append(['Subdivision de recensement', town, characteristic,
+                         value.format(population=1000 * (i + 1)), '0'])
+    data_csv = "\n".join(",".join(f'"{cell}"' for cell in row) for row in rows) + "\n"
+    decoy_csv = data_csv.replace('Subdivision de recensement', 'Décoy')
+
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as thezip:
+        thezip.writestr('decoy_CSV_data.csv', decoy_csv.encode('ISO-8859-1'))
+        thezip.writestr('98-401-X2021005_Francais_meta.txt', "Métadonnées".encode('ISO-8859-1'))
+        thezip.writestr(CENSUS_MEMBER, data_csv.encode('ISO-8859-1'))
+
+
+def check_census_download():
+    """
+    Serves a stand-in census archive from a local HTTP server, runs
+    download_and_process_census_data against it and checks the CSV and Parquet outputs.
+    Returns the list of failed checks (empty when everything matches).
+    """
+    towns = ['Alpha', 'Bêta', 'Gamma']
+    failures = []
+    previous_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_directory:
+        os.chdir(work_directory)
+        served_directory = os.path.join(work_directory, 'served')
+        os.makedirs(served_directory)
+        build_stand_in_archive(os.path.join(served_directory, 'census.zip'), towns)
+        pd.DataFrame({'munnom': ['Ville Alpha', 'Ville Bêta'],
+                      'NIVEAU_GÉO': ['Subdivision de recensement'] * 2,
+                      'NOM_GÉO': ['Alpha', 'Bêta']}).to_csv('MUN.csv', index=False)
+
+        handler = functools.partial(QuietHandler, directory=served_directory)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            download_and_process_census_data(url=f"http://127.0.0.1:{server.server_port}/census.zip",
+                                              zip_path='census_data.zip', mun_file_path='MUN.csv')
+        finally:
+            server.shutdown()
+            os.chdir(previous_directory)
+
+        csv_path = os.path.join(work_directory, 'Recensement_de_la_population.csv')
+        store_path = os.path.join(work_directory, downloadQuanti.CENSUS_STORE_PATH)
+        if not os.path.exists(csv_path) or not os.path.exists(store_path):
+            failures.append("No CSV or Parquet output written")
+        else:
+            wide = pd.read_csv(csv_path, encoding='utf-8-sig', index_col=0, dtype=str)
+            expected = pd.DataFrame({'Ville Alpha': ['1000', 'x', '41.2'], 'Ville Bêta': ['2000', 'x', '41.2']},
+                                    index=[characteristic for characteristic, _ in CHARACTERISTICS])
+            expected.index.name = 'NOM_CARACTÉRISTIQUE'
+            if not wide.equals(expected):
+                failures.append(f"Unexpected CSV output:\n{wide}")
+
+            store = pd.read_parquet(store_path)
+            if sorted(store.index.unique()) != ['Alpha', 'Bêta']:
+                failures.append(f"Unexpected municipalities in the Parquet store: {list(store.index.unique())}")
+            if store['C1_CHIFFRE_TOTAL_NUM'].isna().sum() != 2:
+                failures.append("Suppressed values should be the only missing numeric values in the store")
+
+    print(f"{len(failures)} failed checks")
+    for failure in failures:
+        print(failure)
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_census_download() else 0)
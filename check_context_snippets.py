@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pandas as pd
+
+from analysis import (PageWordIndex, build_keyword_matcher,
+                      extract_keyword_phrase_centered, extract_page_texts)
+
+
+def check_context_snippets(folder_path, keywords_dict):
+    """
+    Compares, for every keyword hit of every PDF in the folder, the snippet built from the
+    page word index with the one extract_keyword_phrase_centered returns.
+    Returns the list of mismatches (empty when the snippets are byte-identical).
+    """
+    matcher = build_keyword_matcher(keywords_dict)
+    keywords = [keyword for category_keywords in keywords_dict.values() for keyword in category_keywords]
+    mismatches = []
+    hits_checked = 0
+
+    for pdf_file in sorted(f for f in os.listdir(folder_path) if f.endswith('.pdf')):
+        pdf_path = os.path.join(folder_path, pdf_file)
+        for page_number, text in enumerate(extract_page_texts(pdf_path), start=1):
+            hits = matcher.find_all(text.lower())
+            word_index = PageWordIndex(text)
+            for keyword in keywords:
+                for start_index in hits.get(keyword.lower(), []):
+                    expected = extract_keyword_phrase_centered(text, keyword, start_index)
+                    snippet = word_index.keyword_phrase_centered(keyword, start_index)
+                    hits_checked += 1
+                    if snippet.encode('utf-8') != expected.encode('utf-8'):
+                        mismatches.append({'file': pdf_file, 'page': page_number, 'keyword': keyword,
+                                           'index': start_index, 'expected': expected, 'snippet': snippet})
+
+    print(f"{hits_checked} hits checked, {len(mismatches)} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        dfKey = pd.read_csv('keywords_category.csv', encoding='utf-8-sig')
+        dfKey['Keywords'] = dfKey['Keywords'].fillna('').astype(str)
+        dfKey['Category'] = dfKey['Category'].fillna('').astype(str)
+        keywords_dict = {row['Category']: row['Keywords'].split('; ') for _, row in dfKey.iterrows()}
+        mismatches = check_context_snippets(sys.argv[1], keywords_dict)
+        sys.exit(1 if mismatches else 0)
+    else:
+        print("❌ Argument de dossier manquant.")
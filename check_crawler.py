@@ -0,0 +1,116 @@
+import functools
+import os
+import sys
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from downloadQuali import download_pdfs_from_url, load_manifest
+
+KEYWORDS = ['climat', 'environnement']
+# Page one shows "Bilan 2022" through a kerned TJ array; the plan has no year anywhere
+REPORT_PDF = (b"%PDF-1.4\n1 0 obj\n<< /Length 52 >>\nstream\n"
+              b"BT /F1 12 Tf 72 712 Td [(Bilan 20)-20(22)] TJ ET\nendstream\nendobj\n%%EOF\n")
+PLAN_PDF = (b"%PDF-1.4\n1 0 obj\n<< /Length 44 >>\nstream\n"
+            b"BT /F1 12 Tf 72 712 Td (Plan environnement) Tj ET\nendstream\nendobj\n%%EOF\n")
+SITE = {
+    'index.html': b'<a href="docs/rapport-climat-2022.pdf">Rapport climat</a>'
+                  b'<a href="docs/copie-rapport-climat.pdf">Copie du rapport</a>'
+                  b'<a href="docs/menu-cafeteria.pdf">Menu</a>'
+                  b'<a href="plan.html">Plan</a>',
+    'plan.html': b'<a href="/docs/plan-environnement.pdf">Plan environnement</a>',
+    'docs/rapport-climat-2022.pdf': REPORT_PDF,
+    'docs/copie-rapport-climat.pdf': REPORT_PDF,  # Same report linked under another name
+    'docs/menu-cafeteria.pdf': b"%PDF-1.4\n%%EOF\n",
+    'docs/plan-environnement.pdf': PLAN_PDF,
+}
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the fixture site quietly and records (path, status) of every response.
+    """
+    responses = []
+
+    def log_request(self, code='-', size='-'):
+        self.responses.append((self.path, int(code)))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def crawl(url, munnom_directory):
+    """
+    Runs one crawl of the fixture site and returns the skipped-files report.
+    """
+    skipped_files_info = []
+    download_pdfs_from_url('Fixture', url, munnom_directory, set(), set(), skipped_files_info, KEYWORDS)
+    return skipped_files_info
+
+
+def check_crawler():
+    """
+    Crawls a fixture site from a local HTTP server twice and checks the keyword filter,
+    the skipped-files report, the year-prefixed names, the hash deduplication and,
+    on the second crawl, the conditional requests answered with 304.
+    Returns the list of failed checks (empty when everything matches).
+    """
+    failures = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        served_directory = os.path.join(work_directory, 'served')
+        for path, content in SITE.items():
+            os.makedirs(os.path.dirname(os.path.join(served_directory, path)), exist_ok=True)
+            with open(os.path.join(served_directory, path), 'wb') as file:
+                file.write(content)
+        munnom_directory = os.path.join(work_directory, 'Fixture')
+
+        handler = functools.partial(RecordingHandler, directory=served_directory)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            skipped = crawl(f"{base_url}/index.html", munnom_directory)
+            first_responses = list(RecordingHandler.responses)
+            RecordingHandler.responses.clear()
+            skipped_again = crawl(f"{base_url}/index.html", munnom_directory)
+            second_responses = list(RecordingHandler.responses)
+        finally:
+            server.shutdown()
+
+        # Keyword filter and skipped-files report
+        for report in (skipped, skipped_again):
+            if [(info['file_name'], info['file_link']) for info in report] != \
+                    [('menu-cafeteria.pdf', f"{base_url}/docs/menu-cafeteria.pdf")]:
+                failures.append(f"Unexpected skipped-files report: {report}")
+        if any(path.endswith('menu-cafeteria.pdf') for path, _ in first_responses + second_responses):
+            failures.append("A PDF rejected by the keyword filter was requested")
+
+        # Year-prefixed names, one stored copy of the report linked twice
+        stored = sorted(f for f in os.listdir(munnom_directory) if f.endswith('.pdf'))
+        if stored not in (['2022_copie-rapport-climat.pdf', 'No_date_plan-environnement.pdf'],
+                          ['2022_rapport-climat-2022.pdf', 'No_date_plan-environnement.pdf']):
+            failures.append(f"Unexpected stored PDFs: {stored}")
+        files = {url.rsplit('/', 1)[1]: entry for url, entry in load_manifest(munnom_directory)['files'].items()}
+        report_statuses = sorted(files[name]['status'] for name in ('rapport-climat-2022.pdf', 'copie-rapport-climat.pdf')
+                                 if name in files)
+        if report_statuses != ['duplicate', 'unchanged']:
+            failures.append(f"Expected one stored report and one duplicate after the second crawl, got {report_statuses}")
+        if len({files[name]['file_name'] for name in ('rapport-climat-2022.pdf', 'copie-rapport-climat.pdf')
+                if name in files}) != 1:
+            failures.append("The duplicate report does not point to the stored copy")
+
+        # Second crawl: every PDF revalidated with a conditional request
+        pdf_statuses = sorted(status for path, status in second_responses if path.endswith('.pdf'))
+        if pdf_statuses != [304, 304, 304]:
+            failures.append(f"Expected three 304 responses for the PDFs on the second crawl, got {pdf_statuses}")
+        if files.get('plan-environnement.pdf', {}).get('status') != 'unchanged':
+            failures.append(f"Unexpected manifest entry for the plan: {files.get('plan-environnement.pdf')}")
+
+    print(f"{len(failures)} failed checks")
+    for failure in failures:
+        print(failure)
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check_crawler() else 0)
@@ -1,15 +1,21 @@
+import asyncio
+import datetime
+import hashlib
 import io
+import itertools
+import json
 import os
 import re
-import shutil
+import sqlite3
 import time
 import tkinter as tk
 import urllib.parse  # For decoding URLs
 import zipfile
+import zlib
 from collections import Counter, defaultdict
 
+import aiohttp
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 from pdfminer.high_level import extract_pages, extract_text
 from pdfminer.layout import LTChar, LTFigure, LTRect, LTTextContainer
@@ -47,28 +53,53 @@ def show_alert(message):
     root.update()
 
 
-def extract_publication_date(pdf_path):
-    try:
-        # Open the PDF file
-        pdf_document = fitz.open(pdf_path)
+YEAR_PATTERN = re.compile(rb'\b(19\d{2}|20\d{2})\b')
+STREAM_PATTERN = re.compile(rb'(?<!end)stream\r?\n')
+LITERAL_STRING_PATTERN = re.compile(rb'\(((?:\\.|[^\\)])*)\)')
+# A whole [(..) kerning (..)] TJ array, or a lone literal string
+TEXT_OPERAND_PATTERN = re.compile(rb'\[((?:\((?:\\.|[^\\)])*\)|[^\](])*)\]\s*TJ|\(((?:\\.|[^\\)])*)\)')
+# Bytes read from the start of a PDF to find its publication year
+PUBLICATION_YEAR_BYTES = 256 * 1024
 
-        # Get the first page
-        first_page = pdf_document[0]
 
-        # Extract text from the first page
-        text = first_page.get_text()
+def detect_publication_year(leading_bytes, max_text_streams=3):
+    """
+    Finds a publication year in the first bytes of a PDF, without parsing the whole document.
+
+    Looks first at the text shown by the first content streams (usually page one), decompressing
+    FlateDecode streams, then at the CreationDate of the document information or XMP metadata.
+    Returns the year as a string, or "No_date".
+    """
+    text_streams = 0
+    for match in STREAM_PATTERN.finditer(leading_bytes):
+        end = leading_bytes.find(b'endstream', match.end())
+        if end == -1:
+            break  # Stream cut by the end of the leading bytes
+        data = leading_bytes[match.end():end]
+        try:
+            content = zlib.decompressobj().decompress(data)
+        except zlib.error:
+            content = data  # Uncompressed stream
+        # Only page content streams showing text: BT ... (string) Tj / [(string)] TJ ... ET
+        if b'BT' not in content or (b'Tj' not in content and b'TJ' not in content):
+            continue
+        # Pieces of one TJ array are one run of text (e.g. [(20)-15(23)] TJ shows "2023")
+        text = b' '.join(b''.join(LITERAL_STRING_PATTERN.findall(operand.group(1))) if operand.group(1) is not None
+                         else operand.group(2)
+                         for operand in TEXT_OPERAND_PATTERN.finditer(content))
+        year = YEAR_PATTERN.search(text)
+        if year:
+            return year.group(1).decode()
+        text_streams += 1
+        if text_streams >= max_text_streams:
+            break
+
+    metadata_date = (re.search(rb'/CreationDate\s*\(\s*D:(\d{4})', leading_bytes)
+                     or re.search(rb'<xmp:CreateDate>\s*(\d{4})', leading_bytes))
+    if metadata_date and YEAR_PATTERN.fullmatch(metadata_date.group(1)):
+        return metadata_date.group(1).decode()
+    return "No_date"
 
-        # Attempt to find any year
-        year_pattern = r'\b(19\d{2}|20\d{2})\b'
-        matches = re.findall(year_pattern, text)
-        
-        if matches:
-            publication_year = matches[0]
-            return publication_year
-        else:
-            return "No_date"
-    except Exception as e:
-        return "No_date"
 
 def contains_keywords(pdf_name, keywords):
     """
@@ -95,92 +126,648 @@ def create_directory(directory_path):
     if not os.path.exists(directory_path):
         os.makedirs(directory_path)
 
-def download_pdfs_from_url(munnom, url, munnom_directory, visited_urls, downloaded_pdfs, skipped_files_info, keywords, depth=0, max_depth=10):
-    
-    if url in visited_urls or depth > max_depth:
-        return
-    visited_urls.add(url)
-
-    try:
-        # Get the HTML of the page
-        response = requests.get(url)
-        response.raise_for_status()  # Ensure the request was successful
-        html = response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to retrieve {url}: {e}")
-        return  # Skip this URL if there are any issues retrieving it
-
-    # Switch to a more lenient parser to handle malformed HTML better
-    soup = BeautifulSoup(html, 'lxml')  # Corrected 'html.parser' to 'lxml'
-
-    # Find all hyperlinks present on the webpage
-    links = soup.find_all('a')
-    for link in links:
-        href = link.get('href')
-        if href:
+def pdf_file_name(full_url):
+    """
+    Builds the local file name of a PDF link: decoded last URL segment, spaces and
+    characters not allowed in file names replaced by underscores.
+    """
+    # Decode the URL to get a proper file name
+    decoded_url = urllib.parse.unquote(full_url)
+    pdf_name = decoded_url.split('/')[-1].replace(' ', '_')  # Replace spaces with underscores
+
+    # Sanitize the pdf_name to remove or replace characters not allowed in file names
+    invalid_chars = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
+    for char in invalid_chars:
+        pdf_name = pdf_name.replace(char, '_')
+    return pdf_name
+
+
+def normalize_for_keywords(text):
+    """
+    Lower-cases the text and turns URL and file-name separators into spaces, as contains_keywords does.
+    """
+    text = urllib.parse.unquote(text).lower()
+    for separator in ['_', '-', '.', '/', '+', '=', '&', '?']:
+        text = text.replace(separator, ' ')
+    return text
+
+
+# Sections of municipal websites that rarely lead to budget or plan documents
+LOW_VALUE_SECTIONS = ['nouvelles', 'actualites', 'actualités', 'evenements', 'événements', 'agenda',
+                      'calendrier', 'communiques', 'communiqués', 'news', 'events', 'emplois', 'carrieres']
+
+
+def link_score(full_url, anchor_text, keywords, depth):
+    """
+    Scores a page link for the crawl frontier: keywords in the anchor text count double,
+    keywords in the URL path count once, news/events sections are penalized and deeper pages
+    slightly less preferred. Higher is fetched first.
+    """
+    anchor = normalize_for_keywords(anchor_text or '')
+    path = normalize_for_keywords(urllib.parse.urlparse(full_url).path)
+    score = 0.0
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        if keyword_lower in anchor:
+            score += 2
+        if keyword_lower in path:
+            score += 1
+    path_words = set(path.split()) | set(anchor.split())
+    if any(section in path_words for section in LOW_VALUE_SECTIONS):
+        score -= 3
+    return score - 0.1 * depth
+
+
+MANIFEST_FILE = 'manifest.json'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_PDF_BYTES = 200 * 1024 * 1024
+
+
+class PdfTooLargeError(Exception):
+    """
+    Raised when a PDF download goes beyond the configured maximum size.
+    """
+
+
+def load_manifest(munnom_directory):
+    """
+    Loads the download manifest of a municipality: for each PDF URL, its ETag, Last-Modified,
+    content hash, local file name and status ('new', 'modified', 'unchanged', 'duplicate' or 'not_seen') at the last crawl.
+    """
+    manifest_path = os.path.join(munnom_directory, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return {'last_crawl': None, 'files': {}}
+
+
+def save_manifest(munnom_directory, manifest):
+    create_directory(munnom_directory)
+    manifest_path = os.path.join(munnom_directory, MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def changed_pdfs(munnom_directory):
+    """
+    Returns the local file names of the PDFs that were new or modified at the last crawl.
+    """
+    manifest = load_manifest(munnom_directory)
+    return [entry['file_name'] for entry in manifest['files'].values() if entry['status'] in ('new', 'modified')]
+
+
+CRAWL_STATE_FILE = 'crawl_state.sqlite'
+
+
+class CrawlState:
+    """
+    Crawl state of one municipality persisted in SQLite: the frontier and visited pages, the outcome
+    and timing of every fetched page, and the outcome of every PDF link. Writes are buffered and
+    committed in batches. A crawl that did not reach its end can be resumed from the stored frontier.
+    """
+    def __init__(self, db_path, batch_size=50, flush_interval=5.0):
+        self.connection = sqlite3.connect(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending_writes = []
+        self.last_flush = time.time()
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY, priority REAL, frontier_order INTEGER, depth INTEGER,
+                status TEXT, outcome TEXT, elapsed REAL, fetched_at TEXT);
+            CREATE TABLE IF NOT EXISTS pdfs (
+                url TEXT PRIMARY KEY, pdf_name TEXT, outcome TEXT, recorded_at TEXT);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.connection.commit()
+
+    def get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def is_resumable(self):
+        return self.get_meta('status') == 'running'
+
+    def start(self, started_at):
+        """
+        Clears the state of the previous crawl and marks a new one as running.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM pages")
+            self.connection.execute("DELETE FROM pdfs")
+            self.connection.execute("DELETE FROM meta")
+            self.connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                        [('status', 'running'), ('started_at', started_at), ('elapsed', '0')])
+
+    def load(self):
+        """
+        Returns the stored state of an interrupted crawl.
+        """
+        rows = self.connection.execute("SELECT url, priority, frontier_order, depth, status FROM pages").fetchall()
+        pdf_rows = self.connection.execute("SELECT url, pdf_name, outcome FROM pdfs").fetchall()
+        return {
+            'started_at': self.get_meta('started_at'),
+            'elapsed': float(self.get_meta('elapsed') or 0),
+            'visited_urls': {row[0] for row in rows},
+            'frontier': [(row[1], row[2], row[0], row[3]) for row in rows if row[4] == 'pending'],
+            'pages_fetched': sum(1 for row in rows if row[4] == 'done'),
+            'next_order': max((row[2] for row in rows), default=-1) + 1,
+            'downloaded_pdfs': {row[1] for row in pdf_rows if row[2] == 'downloaded'},
+            'skipped_pdfs': [(row[0], row[1]) for row in pdf_rows if row[2] == 'skipped'],
+        }
+
+    def write(self, sql, params):
+        self.pending_writes.append((sql, params))
+        if len(self.pending_writes) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def add_page(self, url, priority, frontier_order, depth):
+        self.write("INSERT OR IGNORE INTO pages (url, priority, frontier_order, depth, status) VALUES (?, ?, ?, ?, 'pending')",
+                   (url, priority, frontier_order, depth))
+
+    def page_done(self, url, outcome, elapsed):
+        self.write("UPDATE pages SET status = 'done', outcome = ?, elapsed = ?, fetched_at = ? WHERE url = ?",
+                   (outcome, elapsed, datetime.datetime.now().isoformat(timespec='seconds'), url))
+
+    def pdf_outcome(self, url, pdf_name, outcome):
+        self.write("INSERT OR REPLACE INTO pdfs VALUES (?, ?, ?, ?)",
+                   (url, pdf_name, outcome, datetime.datetime.now().isoformat(timespec='seconds')))
+
+    def flush(self, elapsed=None):
+        with self.connection:
+            for sql, params in self.pending_writes:
+                self.connection.execute(sql, params)
+            if elapsed is not None:
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('elapsed', ?)", (str(elapsed),))
+        self.pending_writes = []
+        self.last_flush = time.time()
+
+    def finish(self, elapsed):
+        self.flush(elapsed)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('status', 'finished')")
+
+    def close(self):
+        self.connection.close()
+
+
+class AsyncPdfCrawler:
+    """
+    Crawls one municipality website and downloads the PDFs whose name matches the keywords.
+
+    Pages are taken best-first from a priority frontier scored by link_score (anchor text, URL path,
+    keywords), within a budget of fetched pages and wall-clock seconds per municipality.
+    They are fetched (no recursion) by a few concurrent workers sharing one
+    keep-alive connection pool, with a limit on concurrent requests per host and a timeout on every request.
+    The keyword filter, the skipped-files report and the year-prefixed file names are the same as before.
+    PDFs already in the municipality manifest are re-requested conditionally and kept when unchanged.
+    Downloads are streamed to disk with a size cap, and byte-identical PDFs are stored only once.
+    The crawl state is kept in a CrawlState database in the municipality folder, so that an interrupted
+    crawl resumes where it stopped.
+    """
+    def __init__(self, munnom, munnom_directory, keywords, visited_urls=None, downloaded_pdfs=None,
+                 skipped_files_info=None, max_depth=10, concurrency_per_host=4, timeout=30,
+                 max_pdf_bytes=MAX_PDF_BYTES, max_pages=500, max_seconds=900, host_semaphores=None):
+        self.munnom = munnom
+        self.munnom_directory = munnom_directory
+        self.keywords = keywords
+        self.visited_urls = visited_urls if visited_urls is not None else set()
+        self.downloaded_pdfs = downloaded_pdfs if downloaded_pdfs is not None else set()
+        self.skipped_files_info = skipped_files_info if skipped_files_info is not None else []
+        self.max_depth = max_depth
+        self.concurrency_per_host = concurrency_per_host
+        self.timeout = timeout
+        self.max_pdf_bytes = max_pdf_bytes
+        self.max_pages = max_pages
+        self.max_seconds = max_seconds
+        self.pages_fetched = 0
+        self.crawl_start_time = None
+        self.frontier_order = itertools.count()
+        self.pending_pdfs = set()
+        # May be shared between crawlers, so that politeness limits hold per host across municipalities
+        self.host_semaphores = host_semaphores if host_semaphores is not None else {}
+        self.manifest = load_manifest(munnom_directory)
+        self.crawl_started_at = None
+        self.state = None
+
+    def budget_exhausted(self):
+        return (self.pages_fetched >= self.max_pages
+                or time.time() - self.crawl_start_time >= self.max_seconds)
+
+    def add_to_frontier(self, queue, full_url, anchor_text, depth):
+        self.visited_urls.add(full_url)
+        score = link_score(full_url, anchor_text, self.keywords, depth)
+        # Highest score first; among equal scores, first discovered first
+        order = next(self.frontier_order)
+        queue.put_nowait((-score, order, full_url, depth))
+        self.state.add_page(full_url, -score, order, depth)
+
+    def host_semaphore(self, url):
+        host = urllib.parse.urlparse(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.concurrency_per_host)
+        return self.host_semaphores[host]
+
+    def record_skip(self, pdf_name, full_url):
+        self.skipped_files_info.append({
+            'mumu': self.munnom,
+            'file_name': pdf_name,
+            'file_link': full_url
+        })
+        self.state.pdf_outcome(full_url, pdf_name, 'skipped')
+        print(f"File skipped (keyword filter): {pdf_name}")
+
+    async def fetch_page(self, session, url):
+        """
+        Returns the HTML of the page, or None if it could not be retrieved.
+        """
+        try:
+            async with self.host_semaphore(url):
+                async with session.get(url) as response:
+                    response.raise_for_status()  # Ensure the request was successful
+                    return await response.text(errors='replace')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to retrieve {url}: {e}")
+            return None  # Skip this URL if there are any issues retrieving it
+
+    async def download_pdf(self, session, full_url, pdf_name):
+        entry = self.manifest['files'].get(full_url)
+        headers = {}
+        # Conditional request when the file from the last crawl is still on disk
+        if entry and os.path.exists(os.path.join(self.munnom_directory, entry['file_name'])):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            async with self.host_semaphore(full_url):
+                async with session.get(full_url, headers=headers) as response:
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    if response.status == 304:
+                        sha256 = None
+                    else:
+                        response.raise_for_status()  # Check if the request was successful
+                        # Stream the PDF to disk under its year-prefixed name, hashing it while it is written
+                        file_name, sha256 = await self.stream_to_file(response, pdf_name)
+
+            if sha256 is None:
+                # Not modified since the last crawl: keep the local copy
+                self.record_download(full_url, pdf_name, entry['file_name'], entry['sha256'], etag or entry.get('etag'),
+                                     last_modified or entry.get('last_modified'), 'unchanged')
+                print(f"File unchanged: {entry['file_name']}")
+            else:
+                self.store_download(full_url, pdf_name, entry, file_name, sha256, etag, last_modified)
+        except PdfTooLargeError as e:
+            print(f"File too large, not downloaded: {full_url} ({e})")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to download {full_url}: {e}")
+        finally:
+            self.pending_pdfs.discard(pdf_name)
+
+        if pdf_name not in self.downloaded_pdfs:
+            self.record_skip(pdf_name, full_url)
+
+    async def stream_to_file(self, response, pdf_name):
+        """
+        Writes the response body chunk by chunk and returns (file_name, sha256).
+        The first bytes are held until the publication year is known, so the file is written
+        once, directly under its final "<year>_<pdf_name>" name. When a file already exists
+        under that name (a changed PDF), the body goes to "<name>.part" first and replaces
+        it only once complete, so a failed download never loses the previous copy.
+        Raises PdfTooLargeError beyond max_pdf_bytes, whether announced by Content-Length or not.
+        """
+        if response.content_length and response.content_length > self.max_pdf_bytes:
+            raise PdfTooLargeError(f"{response.content_length} bytes announced")
+        sha256 = hashlib.sha256()
+        size = 0
+        leading_chunks = []
+        f = None
+        pdf_path = None
+        write_path = None
+
+        def open_output():
+            nonlocal file_name, pdf_path, write_path
+            file_name = f"{detect_publication_year(b''.join(leading_chunks))}_{pdf_name}"
+            pdf_path = os.path.join(self.munnom_directory, file_name)
+            write_path = pdf_path + '.part' if os.path.exists(pdf_path) else pdf_path
+            output = open(write_path, 'wb')
+            output.write(b''.join(leading_chunks))
+            return output
+
+        file_name = None
+        try:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_pdf_bytes:
+                    raise PdfTooLargeError(f"more than {self.max_pdf_bytes} bytes")
+                sha256.update(chunk)
+                if f is None:
+                    leading_chunks.append(chunk)
+                    if size < PUBLICATION_YEAR_BYTES:
+                        continue
+                    f = open_output()
+                    leading_chunks = []
+                else:
+                    f.write(chunk)
+            if f is None:
+                # Whole file smaller than the leading bytes
+                f = open_output()
+            f.close()
+            if write_path != pdf_path:
+                os.replace(write_path, pdf_path)
+        except BaseException:
+            if f is not None:
+                f.close()
+            # Only the file written by this download is removed, never a previous copy
+            if write_path and os.path.exists(write_path):
+                os.remove(write_path)
+            raise
+        return file_name, sha256.hexdigest()
+
+    def store_download(self, full_url, pdf_name, entry, file_name, sha256, etag, last_modified):
+        """
+        Keeps the streamed file unless the same content is already stored, under this URL or another one.
+        """
+        if entry and entry['sha256'] == sha256 and os.path.exists(os.path.join(self.munnom_directory, entry['file_name'])):
+            if file_name != entry['file_name']:
+                os.remove(os.path.join(self.munnom_directory, file_name))
+            self.record_download(full_url, pdf_name, entry['file_name'], sha256, etag, last_modified, 'unchanged')
+            print(f"File unchanged: {entry['file_name']}")
+            return
+
+        duplicate_of = self.stored_file_with_hash(sha256, full_url)
+        if duplicate_of and duplicate_of != file_name:
+            # Byte-identical to a PDF linked under another URL: keep a single copy
+            os.remove(os.path.join(self.munnom_directory, file_name))
+            self.record_download(full_url, pdf_name, duplicate_of, sha256, etag, last_modified, 'duplicate')
+            print(f"File duplicate of {duplicate_of}: {pdf_name}")
+        else:
+            print(f"File downloaded: {file_name}")
+            # New content under this name: the analysis of the previous copy no longer applies
+            self.remove_analysis_results(file_name)
+            self.record_download(full_url, pdf_name, file_name, sha256, etag, last_modified,
+                                 'modified' if entry else 'new')
+
+        if entry and entry['file_name'] != self.manifest['files'][full_url]['file_name']:
+            self.remove_if_unreferenced(entry['file_name'])
+
+    def stored_file_with_hash(self, sha256, excluded_url):
+        for url, other in self.manifest['files'].items():
+            if url != excluded_url and other['sha256'] == sha256 and other['status'] != 'duplicate' \
+                    and os.path.exists(os.path.join(self.munnom_directory, other['file_name'])):
+                return other['file_name']
+        return None
+
+    def remove_if_unreferenced(self, file_name):
+        if any(other['file_name'] == file_name for other in self.manifest['files'].values()):
+            return
+        old_path = os.path.join(self.munnom_directory, file_name)
+        if os.path.exists(old_path):
+            os.remove(old_path)
+        self.remove_analysis_results(file_name)
+
+    def remove_analysis_results(self, file_name):
+        """
+        Deletes the "<base>.xlsx" written by the analysis of a PDF, so that it is analysed again.
+        """
+        excel_path = os.path.join(self.munnom_directory, f'{os.path.splitext(file_name)[0]}.xlsx')
+        if os.path.exists(excel_path):
+            os.remove(excel_path)
+
+    def record_download(self, full_url, pdf_name, file_name, sha256, etag, last_modified, status):
+        previous = self.manifest['files'].get(full_url)
+        # Revalidating a duplicate (304 or same content) does not make it a stored copy of its own
+        if status == 'unchanged' and previous and previous['status'] == 'duplicate':
+            status = 'duplicate'
+        # Add the downloaded PDF to the set, the crawl state and the manifest
+        self.downloaded_pdfs.add(pdf_name)
+        self.state.pdf_outcome(full_url, pdf_name, 'downloaded')
+        self.manifest['files'][full_url] = {
+            'pdf_name': pdf_name,
+            'file_name': file_name,
+            'sha256': sha256,
+            'etag': etag,
+            'last_modified': last_modified,
+            'status': status,
+            'checked_at': self.crawl_started_at
+        }
+
+    async def crawl_page(self, session, queue, url, depth):
+        """
+        Fetches a page, downloads its PDFs and extends the frontier. Returns the page outcome.
+        """
+        html = await self.fetch_page(session, url)
+        if html is None:
+            return 'failed'
+
+        # Switch to a more lenient parser to handle malformed HTML better
+        soup = BeautifulSoup(html, 'lxml')
+
+        # Find all hyperlinks present on the webpage
+        pdf_downloads = []
+        for link in soup.find_all('a'):
+            href = link.get('href')
+            if not href:
+                continue
             # Complete the URL if it's relative
             full_url = href if href.startswith('http') else urllib.parse.urljoin(url, href)
 
             # Check if the link is to a PDF and download it
             if '.pdf' in href:
-                # Decode the URL to get a proper file name
-                decoded_url = urllib.parse.unquote(full_url)
-                pdf_name = decoded_url.split('/')[-1].replace(' ', '_')  # Replace spaces with underscores
-                
-                # Sanitize the pdf_name to remove or replace characters not allowed in file names
-                invalid_chars = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
-                for char in invalid_chars:
-                    pdf_name = pdf_name.replace(char, '_')
-                    
-
-
-                # Check if the PDF has already been downloaded
-                if (pdf_name not in downloaded_pdfs) and (contains_keywords(pdf_name, keywords)):
-                    try:
-                        pdf_response = requests.get(full_url)
-                        pdf_response.raise_for_status()  # Check if the request was successful
-                        pdf_content = pdf_response.content
-                        
-                        # Save the PDF to disk
-                        pdf_path = os.path.join(munnom_directory, pdf_name)
-                        with open(pdf_path, 'wb') as f:
-                            f.write(pdf_content)
-                        
-                        # Add the downloaded PDF to the set
-                        downloaded_pdfs.add(pdf_name)
-                        print(f"File downloaded: {pdf_name}")
-                        try:
-                            publication_year = extract_publication_date(pdf_path)
-                            # Generate new name
-                            new_name = f"{publication_year}_{pdf_name}"
-                            new_path = os.path.join(munnom_directory, new_name)
-
-                            # Rename the file
-                            try:
-                                shutil.move(pdf_path, new_path)
-                                print(f"Renamed '{pdf_name}' to '{new_name}'")
-                            except FileNotFoundError as e:
-                                print(f"Error renaming '{pdf_name}': {e}")
-
-                        except Exception as e:
-                            print(f"Error processing '{pdf_name}': {e}")
-                            
-                    except requests.exceptions.RequestException as e:
-                        print(f"Failed to download {full_url}: {e}")
-                
-                    
-                if pdf_name not in downloaded_pdfs:
-                        skipped_files_info.append({
-                            'mumu': munnom,
-                             'file_name': pdf_name,
-                              'file_link': full_url
-                         })
-                        print(f"File skipped (keyword filter): {pdf_name}")
-
-            # If the link is not a PDF and is a page within the same site, recurse into it with increased depth
+                pdf_name = pdf_file_name(full_url)
+                if pdf_name in self.downloaded_pdfs or pdf_name in self.pending_pdfs:
+                    continue
+                if contains_keywords(pdf_name, self.keywords):
+                    self.pending_pdfs.add(pdf_name)
+                    pdf_downloads.append(self.download_pdf(session, full_url, pdf_name))
+                else:
+                    self.record_skip(pdf_name, full_url)
+
+            # If the link is a page within the same site, add it to the frontier one level deeper
             elif urllib.parse.urlparse(full_url).netloc == urllib.parse.urlparse(url).netloc:
-                download_pdfs_from_url(munnom, full_url, munnom_directory, visited_urls, downloaded_pdfs, skipped_files_info, keywords, depth + 1, max_depth)
+                if full_url not in self.visited_urls and depth + 1 <= self.max_depth:
+                    self.add_to_frontier(queue, full_url, link.get_text(' ', strip=True), depth + 1)
+
+        await asyncio.gather(*pdf_downloads)
+        print(f"All available PDF files from {url} have been downloaded.")
+        return 'ok'
+
+    async def worker(self, session, queue):
+        while True:
+            _, _, url, depth = await queue.get()
+            try:
+                # Once the budget is spent, the remaining frontier is drained without fetching
+                if self.budget_exhausted():
+                    continue
+                self.pages_fetched += 1
+                start_time = time.time()
+                try:
+                    outcome = await self.crawl_page(session, queue, url, depth)
+                except Exception:
+                    self.state.page_done(url, 'error', time.time() - start_time)
+                    raise
+                # A page interrupted by cancellation stays pending, so a resumed crawl fetches it again
+                self.state.page_done(url, outcome, time.time() - start_time)
+            except Exception as e:
+                print(f"Error crawling {url}: {e}")
+            finally:
+                queue.task_done()
+
+    def restore_state(self, queue):
+        """
+        Reloads the frontier, visited pages and PDF outcomes of an interrupted crawl.
+        """
+        stored = self.state.load()
+        self.crawl_started_at = stored['started_at']
+        self.crawl_start_time = time.time() - stored['elapsed']
+        self.pages_fetched = stored['pages_fetched']
+        self.frontier_order = itertools.count(stored['next_order'])
+        self.visited_urls.update(stored['visited_urls'])
+        self.downloaded_pdfs.update(stored['downloaded_pdfs'])
+        for full_url, pdf_name in stored['skipped_pdfs']:
+            self.skipped_files_info.append({'mumu': self.munnom, 'file_name': pdf_name, 'file_link': full_url})
+        for item in stored['frontier']:
+            queue.put_nowait(item)
+        print(f"Resuming crawl of {self.munnom}: {self.pages_fetched} pages already fetched, "
+              f"{len(stored['frontier'])} in the frontier")
+
+    async def crawl(self, start_url, session=None):
+        """
+        Crawls from 'start_url' until the frontier is empty or the budget is spent, or resumes
+        the interrupted crawl stored in the municipality folder. A session may be shared between crawlers.
+        """
+        create_directory(self.munnom_directory)
+        self.state = CrawlState(os.path.join(self.munnom_directory, CRAWL_STATE_FILE))
+        queue = asyncio.PriorityQueue()
+        if self.state.is_resumable():
+            self.restore_state(queue)
+        else:
+            self.crawl_started_at = datetime.datetime.now().isoformat(timespec='seconds')
+            self.crawl_start_time = time.time()
+            self.pages_fetched = 0
+            self.state.start(self.crawl_started_at)
+            if start_url not in self.visited_urls:
+                self.add_to_frontier(queue, start_url, '', 0)
+
+        owns_session = session is None
+        if owns_session:
+            connector = aiohttp.TCPConnector(limit_per_host=self.concurrency_per_host, ttl_dns_cache=300)
+            # Connection and read timeouts rather than a total one, so that large PDFs can stream
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        finished = False
+        workers = []
+        try:
+            workers = [asyncio.create_task(self.worker(session, queue)) for _ in range(self.concurrency_per_host)]
+            await queue.join()
+            finished = True
+            print(f"{self.munnom}: {self.pages_fetched} pages fetched in {time.time() - self.crawl_start_time:.2f} seconds"
+                  f"{' (budget reached)' if self.budget_exhausted() else ''}")
+        finally:
+            # Also on interruption: no worker may outlive the session and the crawl state
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if owns_session:
+                await session.close()
+            if finished:
+                # Files linked at the last crawl but not found this time
+                for entry in self.manifest['files'].values():
+                    if entry['checked_at'] != self.crawl_started_at:
+                        entry['status'] = 'not_seen'
+                self.manifest['last_crawl'] = self.crawl_started_at
+                self.state.finish(time.time() - self.crawl_start_time)
+            else:
+                # Interrupted: keep what was done so the next call resumes from here
+                self.state.flush(time.time() - self.crawl_start_time)
+            self.state.close()
+            save_manifest(self.munnom_directory, self.manifest)
+
+
+def download_pdfs_from_url(munnom, url, munnom_directory, visited_urls, downloaded_pdfs, skipped_files_info, keywords, depth=0, max_depth=10,
+                           max_pages=500, max_seconds=900, max_pdf_bytes=MAX_PDF_BYTES):
+    """
+    Downloads the PDFs of a municipality website with AsyncPdfCrawler, filling the given sets and skipped-files list.
+    """
+    crawler = AsyncPdfCrawler(munnom, munnom_directory, keywords, visited_urls, downloaded_pdfs,
+                              skipped_files_info, max_depth=max_depth - depth, max_pdf_bytes=max_pdf_bytes,
+                              max_pages=max_pages, max_seconds=max_seconds)
+    asyncio.run(crawler.crawl(url))
 
-    print(f"All available PDF files from {url} have been downloaded.")
 
+def municipality_url(mweb):
+    return 'https://' + mweb if not mweb.startswith('http') else mweb
 
+
+async def crawl_municipalities(municipalities, keywords, base_directory='pdfs_downloaded_filter', max_connections=32,
+                               concurrency_per_host=4, max_concurrent_crawls=8, timeout=30, max_pages=500,
+                               max_seconds=900, max_pdf_bytes=MAX_PDF_BYTES, progress_callback=None):
+    """
+    Crawls many municipalities at once over one shared connection pool.
+
+    :param municipalities: Iterable of (munnom, mweb) pairs, e.g. from MUN.csv.
+    :param max_connections: Global limit of open connections across all municipalities.
+    :param concurrency_per_host: Politeness limit of concurrent requests to one host.
+    :param max_concurrent_crawls: Number of municipality crawls running at the same time.
+    :param max_pdf_bytes: Size above which a PDF download is abandoned.
+    :param progress_callback: Called with (munnom, stats) when a municipality is done.
+    :return: Dictionary of per-municipality stats (pages, PDFs, seconds, pages per second).
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=concurrency_per_host, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    host_semaphores = {}
+    crawl_slots = asyncio.Semaphore(max_concurrent_crawls)
+    results = {}
+    run_start_time = time.time()
+
+    async def crawl_one(session, munnom, mweb):
+        async with crawl_slots:
+            munnom_directory = os.path.join(base_directory, munnom)
+            skipped_files_info = []
+            crawler = AsyncPdfCrawler(munnom, munnom_directory, keywords, skipped_files_info=skipped_files_info,
+                                      concurrency_per_host=concurrency_per_host, timeout=timeout, max_pdf_bytes=max_pdf_bytes,
+                                      max_pages=max_pages, max_seconds=max_seconds, host_semaphores=host_semaphores)
+            print(f"Start downloading for {munnom}")
+            start_time = time.time()
+            error = None
+            try:
+                await crawler.crawl(municipality_url(mweb), session=session)
+            except Exception as e:
+                error = str(e)
+                print(f"Crawl failed for {munnom}: {e}")
+            elapsed_time = time.time() - start_time
+
+            create_directory(munnom_directory)
+            df_skipped = pd.DataFrame(skipped_files_info)
+            df_skipped.to_excel(os.path.join(munnom_directory, 'skipped_files_info.xlsx'), index=False)
+
+            stats = {
+                'pages': crawler.pages_fetched,
+                'pdfs': len(crawler.downloaded_pdfs),
+                'skipped': len(skipped_files_info),
+                'seconds': elapsed_time,
+                'pages_per_second': crawler.pages_fetched / elapsed_time if elapsed_time else 0.0,
+                'error': error
+            }
+            results[munnom] = stats
+            print(f"Time taken for {munnom}: {elapsed_time:.2f} seconds, {stats['pages']} pages, {stats['pdfs']} PDFs "
+                  f"({stats['pages_per_second']:.2f} pages/s), {len(results)} municipalities done "
+                  f"after {time.time() - run_start_time:.2f} seconds")
+            if progress_callback:
+                progress_callback(munnom, stats)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        await asyncio.gather(*(crawl_one(session, munnom, mweb) for munnom, mweb in municipalities))
+    return results
+
+
+def download_all_municipalities(mun_df, keywords, base_directory='pdfs_downloaded_filter', progress_callback=None, **kwargs):
+    """
+    Runs crawl_municipalities for every municipality of the MUN.csv DataFrame that has a website.
+    """
+    municipalities = [(row['munnom'], row['mweb']) for _, row in mun_df.iterrows() if isinstance(row['mweb'], str)]
+    return asyncio.run(crawl_municipalities(municipalities, keywords, base_directory=base_directory,
+                                            progress_callback=progress_callback, **kwargs))
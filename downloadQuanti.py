@@ -1,4 +1,3 @@
-import io
 import os
 import time
 import zipfile
@@ -7,25 +6,64 @@ import pandas as pd
 import requests
 
 
+# Only these columns of the census profile are used, with explicit dtypes
+CENSUS_COLUMNS = ['NIVEAU_GÉO', 'NOM_GÉO', 'NOM_CARACTÉRISTIQUE', 'C1_CHIFFRE_TOTAL']
+CENSUS_DTYPES = {
+    'NIVEAU_GÉO': 'str',
+    'NOM_GÉO': 'str',
+    'NOM_CARACTÉRISTIQUE': 'category',
+    'C1_CHIFFRE_TOTAL': 'str'
+}
+CENSUS_STORE_PATH = 'Recensement_de_la_population.parquet'
+
+
+def read_census_for_municipalities(census_source, mun_df, chunksize=500_000):
+    """
+    Reads the needed columns of the census CSV in chunks and keeps, in one join per chunk,
+    the rows of every municipality of mun_df (matched on 'NIVEAU_GÉO' and 'NOM_GÉO').
+    Returns a long DataFrame with a 'munnom' column, in the order of the CSV.
+    """
+    keys = mun_df[['munnom', 'NIVEAU_GÉO', 'NOM_GÉO']].dropna(subset=['NIVEAU_GÉO', 'NOM_GÉO'])
+    keys = keys.astype({'NIVEAU_GÉO': 'str', 'NOM_GÉO': 'str'})
+    parts = []
+    for chunk in pd.read_csv(census_source, encoding='ISO-8859-1', usecols=CENSUS_COLUMNS,
+                             dtype=CENSUS_DTYPES, chunksize=chunksize):
+        parts.append(chunk.merge(keys, on=['NIVEAU_GÉO', 'NOM_GÉO'], how='inner'))
+    census_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=CENSUS_COLUMNS + ['munnom'])
+    # 'C1_CHIFFRE_TOTAL' stays as written by StatCan, suppression markers ('x', '..') included
+    census_df['NOM_CARACTÉRISTIQUE'] = census_df['NOM_CARACTÉRISTIQUE'].astype('str')
+    return census_df
+
+
+def load_census(nom_geo=None, store_path=CENSUS_STORE_PATH):
+    """
+    Reads the census store, or only the rows of one 'NOM_GÉO' when given.
+    """
+    filters = [('NOM_GÉO', '==', nom_geo)] if nom_geo is not None else None
+    return pd.read_parquet(store_path, filters=filters)
+
+
 def process_city_data(file_path, mun_file_path):
     try:
-        # Read the CSV file containing census data
-        census_df = pd.read_csv(file_path, encoding='ISO-8859-1')
+        # Read only the needed columns of the census data, filtered for all municipalities at once
         mun_df = pd.read_csv(mun_file_path)
+        census_df = read_census_for_municipalities(file_path, mun_df)
+
+        # Store the filtered census in Parquet, indexed by 'NOM_GÉO', for fast later lookups,
+        # with a nullable numeric copy of the values (suppressed or unavailable values are <NA>)
+        census_store = census_df.assign(
+            C1_CHIFFRE_TOTAL_NUM=pd.to_numeric(census_df['C1_CHIFFRE_TOTAL'], errors='coerce').astype('Float64')
+        )
+        census_store.set_index('NOM_GÉO').to_parquet(CENSUS_STORE_PATH)
 
         # Initialize an empty list to store the formatted DataFrames
         city_dfs = []
+        city_groups = dict(tuple(census_df.groupby('munnom', sort=False)))
+        for city_name in mun_df['munnom']:
+            city_df = city_groups.get(city_name)
 
-        # Iterate over each row in the mun_df DataFrame
-        for index, row in mun_df.iterrows():
-            city_name = row['munnom']
-            
-            # Filter the census DataFrame based on 'NIVEAU_GÉO' and 'NOM_GÉO'
-            city_df = census_df[(census_df['NIVEAU_GÉO'] == row['NIVEAU_GÉO']) & 
-                                (census_df['NOM_GÉO'] == row['NOM_GÉO'])]
-            
             # Check if the filtered DataFrame is not empty
-            if not city_df.empty:
+            if city_df is not None and not city_df.empty:
                 # Format the DataFrame by setting 'NOM_CARACTÉRISTIQUE' as the index and renaming the column
                 formatted_city_df = city_df.set_index('NOM_CARACTÉRISTIQUE')['C1_CHIFFRE_TOTAL'].rename(city_name)
                 
@@ -48,55 +86,61 @@ def process_city_data(file_path, mun_file_path):
         print("Error processing the data:", e)
         return None
 
-def download_and_process_census_data():
+CENSUS_URL = 'https://www12.statcan.gc.ca/census-recensement/2021/dp-pd/prof/details/download-telecharger/comp/GetFile.cfm?Lang=F&FILETYPE=CSV&GEONO=005'
+CENSUS_MEMBER = '98-401-X2021005_Francais_CSV_data.csv'
+
+
+def download_file(url, path, chunk_size=1024 * 1024, timeout=60):
+    """
+    Streams the response body to 'path' chunk by chunk, so the file is never held in memory.
+    """
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        with open(path, 'wb') as file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+
+
+def find_census_member(thezip, member_name):
+    """
+    Returns the name of the census data CSV in the archive: 'member_name' if present,
+    otherwise the first member ending with '_CSV_data.csv'.
+    """
+    names = thezip.namelist()
+    if member_name in names:
+        return member_name
+    for name in names:
+        if name.endswith('_CSV_data.csv'):
+            return name
+    raise FileNotFoundError(f"No census data CSV in the archive (expected {member_name})")
+
+
+def download_and_process_census_data(url=CENSUS_URL, zip_path='census_data.zip', member_name=CENSUS_MEMBER,
+                                     mun_file_path='MUN.csv'):
     """
-    Downloads a ZIP file from the given URL, extracts its contents, processes the census data CSV,
-    and calls the provided processing function.
+    Streams the census ZIP file to disk, then streams its data CSV member, decompressed on the fly,
+    straight into process_city_data. No other member is extracted and the CSV is read only once.
     
     Args:
-        url (str): The URL to download the ZIP file from.
+        url (str): The URL to download the ZIP file from (a local stand-in archive can be served instead).
         zip_path (str): Local path to save the ZIP file.
-        extract_dir (str): Directory to extract the ZIP contents.
-        csv_path (str): Path to the specific CSV file in the extracted data.
-        mun_output_path (str): Path to save the processed city data.
-        process_city_data_fn (callable): A function to process the city data.
+        member_name (str): Name of the census data CSV inside the archive.
+        mun_file_path (str): Path of the municipalities CSV (MUN.csv).
     """
     # Start the timer
     start_time = time.time()
-    url = 'https://www12.statcan.gc.ca/census-recensement/2021/dp-pd/prof/details/download-telecharger/comp/GetFile.cfm?Lang=F&FILETYPE=CSV&GEONO=005'
-    # Local path to save the ZIP file
-    zip_path = 'census_data.zip'
 
     try:
         # Download the ZIP file
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Save the ZIP file locally
-        with open(zip_path, 'wb') as file:
-            file.write(response.content)
-        
-        # Unzip the contents
-        with zipfile.ZipFile(io.BytesIO(response.content)) as thezip:
-            thezip.extractall('census_data')
-        
-        print(f"ZIP file successfully downloaded and extracted to census_data.")
-
-        # Attempt to read the specified CSV file
-        try:
-            # Replace 'your_file.csv' with the path to your CSV file
-            csv_path = 'census_data/98-401-X2021005_Francais_CSV_data.csv'
-
-            # Read the CSV file into a DataFrame
-            df = pd.read_csv(csv_path, encoding='ISO-8859-1')
-            print(f"CSV file '{csv_path}' successfully loaded.")
-        except Exception as e:
-            print(f"Error reading the CSV file '{csv_path}':", e)
-            return
+        download_file(url, zip_path)
+        print(f"ZIP file successfully downloaded to {zip_path}.")
 
-        # Process the city data using the provided function
-        mun_df = 'MUN.csv'
-        process_city_data(csv_path, mun_df)
+        # Process the city data straight from the archive member
+        with zipfile.ZipFile(zip_path) as thezip:
+            csv_name = find_census_member(thezip, member_name)
+            with thezip.open(csv_name) as csv_file:
+                print(f"Reading '{csv_name}' from the archive.")
+                process_city_data(csv_file, mun_file_path)
 
         # End the timer
         end_time = time.time()
@@ -105,4 +149,4 @@ def download_and_process_census_data():
     except requests.HTTPError as http_err:
         print(f"HTTP error occurred: {http_err}")
     except Exception as err:
-        print(f"An error occurred: {err}")
\ No newline at end of file
+        print(f"An error occurred: {err}")
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.environ.get(
+    'SMARTESG_LLM_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cache.sqlite')
+)
+# Beyond this size, the least recently used responses are evicted
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class LLMCache:
+    """
+    SQLite cache of LLM responses, keyed by model, messages and request parameters.
+    Only deterministic (temperature 0) requests are cached.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, messages, params):
+        # Numbers are compared as floats, so that temperature=0 and temperature=0.0 share entries
+        params = {name: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+                  for name, value in params.items()}
+        payload = json.dumps({'model': model, 'messages': messages, 'params': params},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def cacheable(params):
+        return params.get('temperature', 1) == 0
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key, model, response):
+        size = len(key) + len(response.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, model, response, size, now, now)
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """
+        Deletes the least recently used responses until the cache is back under 90% of its size limit.
+        """
+        target = int(self.max_bytes * 0.9)
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def cached_call(self, model, messages, params, call):
+        """
+        Returns the cached response text of the request, or the text returned by 'call()'
+        (which performs the request) after storing it.
+        """
+        if not self.cacheable(params):
+            return call()
+        key = self.make_key(model, messages, params)
+        response = self.get(key)
+        if response is None:
+            response = call()
+            self.put(key, model, response)
+        return response
+
+    async def cached_call_async(self, model, messages, params, call):
+        """
+        Same as cached_call, for a 'call' returning a coroutine.
+        """
+        if not self.cacheable(params):
+            return await call()
+        key = self.make_key(model, messages, params)
+        response = self.get(key)
+        if response is None:
+            response = await call()
+            self.put(key, model, response)
+        return response
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': entries, 'bytes': self.total_bytes}
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """
+    Returns the cache shared by every LLM call site of the process, opened on first use.
+    """
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache()
+    return _llm_cache
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import PyPDF2
+
+# Bump when the way text is extracted changes, so that stale entries are ignored
+EXTRACTOR_VERSION = 1
+CACHE_DIRECTORY = os.environ.get(
+    'SMARTESG_TEXT_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'text_cache')
+)
+
+# Digests already computed in this process, keyed by (path, size, modification time)
+_digests = {}
+
+
+def file_sha256(pdf_path):
+    """
+    Returns the SHA-256 of the file content, read in blocks.
+    """
+    stat = os.stat(pdf_path)
+    key = (os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        sha256 = hashlib.sha256()
+        with open(pdf_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(block)
+        _digests[key] = sha256.hexdigest()
+    return _digests[key]
+
+
+def _entry_path(digest):
+    return os.path.join(CACHE_DIRECTORY, digest[:2], f"{digest}.v{EXTRACTOR_VERSION}.json")
+
+
+def _read_entry(digest):
+    try:
+        with open(_entry_path(digest), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'sha256': digest, 'version': EXTRACTOR_VERSION, 'pages': None, 'ocr': {}}
+
+
+def _write_entry(entry):
+    """
+    Merges the entry with what is on disk and replaces the file atomically,
+    so that concurrent readers never see a partial file.
+    """
+    path = _entry_path(entry['sha256'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    on_disk = _read_entry(entry['sha256'])
+    if entry['pages'] is None:
+        entry['pages'] = on_disk['pages']
+    for ocr_key, ocr_pages in on_disk['ocr'].items():
+        entry['ocr'].setdefault(ocr_key, {})
+        for page_number, text in ocr_pages.items():
+            entry['ocr'][ocr_key].setdefault(page_number, text)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(entry, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def get_page_texts(pdf_path):
+    """
+    Returns the digital text layer of every page (empty string when a page has none).
+    The PDF is parsed only the first time its content is seen; errors from PyPDF2 are raised.
+    """
+    entry = _read_entry(file_sha256(pdf_path))
+    if entry['pages'] is None:
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            entry['pages'] = [page.extract_text() or '' for page in reader.pages]
+        _write_entry(entry)
+    return entry['pages']
+
+
+def ocr_pdf_pages(pdf_path, page_numbers, lang, dpi):
+    """
+    Default OCR: rasterizes and reads the given pages (numbered from 1) one at a time.
+    Returns {page_number: text}.
+    """
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    texts = {}
+    for page_number in page_numbers:
+        images = convert_from_path(pdf_path, first_page=page_number, last_page=page_number, dpi=dpi)
+        texts[page_number] = "\n".join(pytesseract.image_to_string(img, lang=lang) for img in images)
+    return texts
+
+
+def get_ocr_texts(pdf_path, page_numbers, lang='fra', dpi=300, ocr_pages=ocr_pdf_pages):
+    """
+    Returns {page_number: text} with the OCR text of the given pages.
+    Only pages never OCR'd for this language and resolution are passed to 'ocr_pages'.
+    """
+    entry = _read_entry(file_sha256(pdf_path))
+    ocr_key = f"{lang}@{dpi}"
+    cached = entry['ocr'].setdefault(ocr_key, {})
+    missing = [page_number for page_number in page_numbers if str(page_number) not in cached]
+    if missing:
+        for page_number, text in ocr_pages(pdf_path, missing, lang, dpi).items():
+            cached[str(page_number)] = text
+        _write_entry(entry)
+    return {page_number: cached[str(page_number)] for page_number in page_numbers}
+
+
+def get_page_texts_with_ocr(pdf_path, lang='fra', dpi=300, ocr_pages=ocr_pdf_pages):
+    """
+    Returns (page_texts, ocr_flags): the digital text of each page, replaced by its OCR text
+    for pages without a text layer, and whether each page was OCR'd.
+    """
+    page_texts = list(get_page_texts(pdf_path))
+    scanned = [i for i, text in enumerate(page_texts, start=1) if not text.strip()]
+    ocr_flags = [False] * len(page_texts)
+    if scanned:
+        for page_number, text in get_ocr_texts(pdf_path, scanned, lang, dpi, ocr_pages).items():
+            page_texts[page_number - 1] = text
+            ocr_flags[page_number - 1] = True
+    return page_texts, ocr_flags